@@ -1,11 +1,14 @@
 """
 نقطة دخول رئيسية لبوت التيليجرام على منصة Render
-يستخدم Webhook للاتصال بواجهة برمجة تطبيق تيليجرام
+يستخدم Webhook للاتصال بواجهة برمجة تطبيق تيليجرام عبر خادم aiohttp غير متزامن
 """
 
+import html
 import logging
 import os
 import sys
+import time
+from datetime import datetime
 from pathlib import Path
 
 # إعداد مسار المجلدات الضرورية
@@ -29,13 +32,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# استيراد Flask بعد إعداد مسارات المجلدات
-from flask import Flask, request, jsonify, render_template
-from bot import build_application, get_bot_instance
-
-# إعداد Flask
-app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", "naturecare_telegram_bot_secret")
+# استيراد aiohttp بعد إعداد مسارات المجلدات
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from bot import build_application, shutdown_application
+from utils.signed_media import MEDIA_ROUTE, resolve_signed_media
 
 # استيراد السر
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
@@ -49,51 +51,97 @@ if not WEBHOOK_URL:
     logger.warning("No WEBHOOK_URL found in environment variables! "
                   "Webhook will not be set automatically.")
 
+WEBHOOK_PATH = f"/webhook/{TELEGRAM_BOT_TOKEN}"
+INDEX_TEMPLATE = current_dir / "tamplates" / "index.html"
+
+# مفتاح تطبيق البوت داخل تطبيق aiohttp
+BOT_APPLICATION_KEY = web.AppKey("bot_application", Application)
+
 # صفحة الترحيب
-@app.route('/')
-def index():
-    return render_template('index.html')
+async def index(request: web.Request) -> web.Response:
+    try:
+        page = INDEX_TEMPLATE.read_text(encoding="utf-8")
+    except OSError as e:
+        logger.error(f"Error loading index page: {e}")
+        return web.Response(text="NatureCare Shipping Bot", content_type="text/html")
+    
+    # تعبئة المتغيرات دون كشف توكن البوت
+    values = {
+        "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "webhook_url": WEBHOOK_URL or "غير مضبوط",
+        "token_path": "webhook/<TOKEN>",
+        "current_year": str(datetime.now().year),
+    }
+    for name, value in values.items():
+        page = page.replace(f"{{{{ {name} }}}}", html.escape(value))
+    
+    return web.Response(text=page, content_type="text/html")
 
 # نقطة نهاية الويب هوك
-@app.route(f'/webhook/{TELEGRAM_BOT_TOKEN}', methods=['POST'])
-def webhook():
-    update = request.json
-    application = get_bot_instance()
+async def webhook(request: web.Request) -> web.Response:
+    application = request.app.get(BOT_APPLICATION_KEY)
+    
+    try:
+        update = Update.de_json(await request.json(), application.bot) if application else None
+    except Exception as e:
+        logger.error(f"Error decoding webhook update: {e}")
+        update = None
     
-    if application and update:
-        application.process_update(update)
-        return jsonify({"status": "success"})
+    if not update:
+        return web.json_response({"status": "error", "message": "Could not process update"}, status=400)
     
-    return jsonify({"status": "error", "message": "Could not process update"}), 400
+    # وضع التحديث في طابور التطبيق ليعالَج في الخلفية، والرد فوراً على تيليجرام
+    await application.update_queue.put(update)
+    
+    return web.json_response({"status": "success"})
+
+# تقديم صور الإشعارات عبر روابط موقعة (لجلبها من Twilio)
+async def media(request: web.Request) -> web.StreamResponse:
+    expires = request.query.get("expires")
+    path = resolve_signed_media(request.match_info["name"], expires, request.query.get("signature"))
+    if path is None:
+        raise web.HTTPNotFound()
+    
+    # FileResponse يدعم ETag وطلبات Range ويرسل الملف عبر sendfile دون نسخه إلى الذاكرة
+    max_age = max(int(expires) - int(time.time()), 0)
+    return web.FileResponse(path, headers={"Cache-Control": f"private, max-age={max_age}"})
 
 # نقطة نهاية للتحقق من الحالة
-@app.route('/health')
-def health():
-    return jsonify({"status": "ok", "message": "Bot is running"}), 200
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "message": "Bot is running"})
 
-# تهيئة التطبيق عند بدء التشغيل
-async def init_app():
-    try:
-        logger.info("Starting bot with webhook.")
-        webhook_path = f"/webhook/{TELEGRAM_BOT_TOKEN}"
-        webhook_url = f"{WEBHOOK_URL}{webhook_path}" if WEBHOOK_URL else None
-        
-        # بناء وتهيئة التطبيق
-        await build_application(webhook_url=webhook_url)
-        logger.info(f"Bot started successfully with webhook URL: {webhook_url}")
-        
-        return True
-    except Exception as e:
-        logger.error(f"Error starting bot: {e}")
-        return False
+# تشغيل البوت وإيقافه مع دورة حياة خادم الويب على نفس حلقة الأحداث
+async def bot_lifecycle(app: web.Application):
+    logger.info("Starting bot with webhook.")
+    webhook_url = f"{WEBHOOK_URL}{WEBHOOK_PATH}" if WEBHOOK_URL else None
+    
+    # بناء وتهيئة وتشغيل التطبيق
+    application = await build_application(webhook_url=webhook_url)
+    await application.start()
+    app[BOT_APPLICATION_KEY] = application
+    logger.info(f"Bot started successfully with webhook URL: {webhook_url}")
+    
+    yield
+    
+    logger.info("Stopping bot.")
+    await shutdown_application()
 
-# تهيئة التطبيق عند بدء التشغيل
-import asyncio
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
-loop.run_until_complete(init_app())
+def create_app() -> web.Application:
+    """
+    إنشاء تطبيق خادم الويب
+    
+    العائد:
+        تطبيق aiohttp مع مسارات الصفحة الرئيسية والصحة والويب هوك والوسائط
+    """
+    app = web.Application()
+    app.router.add_get("/", index)
+    app.router.add_get("/health", health)
+    app.router.add_post(WEBHOOK_PATH, webhook)
+    app.router.add_get(MEDIA_ROUTE + "/{name}", media)
+    app.cleanup_ctx.append(bot_lifecycle)
+    return app
 
 # نقطة الدخول للتشغيل
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 10000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    web.run_app(create_app(), host='0.0.0.0', port=port)
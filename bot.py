@@ -22,9 +22,19 @@ from telegram.ext import (
 # استيراد معالجات البوت
 from handlers.admin_handlers import get_admin_handlers
 from handlers.user_handlers import get_user_handlers
-from handlers.notification_handlers import get_notification_handlers
-from handlers.ai_handlers import get_ai_handlers
+from handlers.notification_handlers import (
+    get_notification_handlers,
+    check_for_reminders,
+    drain_outbox,
+    REMINDER_CHECK_INTERVAL,
+    OUTBOX_DRAIN_INTERVAL,
+)
+from handlers.ai_handlers import get_ai_handlers, close_ai_clients, expire_ai_conversations
+from utils.conversation_memory import AI_MEMORY_IDLE_TIMEOUT
 from utils.database import setup_database
+from utils.rate_limiter import PriorityRateLimiter
+from utils.twilio_sender import close_twilio_client
+from utils.update_processor import ChatOrderedUpdateProcessor
 
 # إعداد السجل
 logger = logging.getLogger(__name__)
@@ -35,6 +45,9 @@ if not TELEGRAM_BOT_TOKEN:
     logger.error("No TELEGRAM_BOT_TOKEN found in environment variables!")
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required")
 
+# الحد الأقصى لعدد التحديثات التي تُعالج بالتوازي (تحديثات المحادثة الواحدة تبقى متسلسلة)
+MAX_CONCURRENT_UPDATES = int(os.environ.get("MAX_CONCURRENT_UPDATES", 16))
+
 # متغير عام لتطبيق البوت
 _application = None
 
@@ -67,7 +80,12 @@ async def build_application(webhook_url: Optional[str] = None) -> Application:
     # بناء تطبيق البوت
     logger.info(f"Building application with token: {TELEGRAM_BOT_TOKEN[:5]}...{TELEGRAM_BOT_TOKEN[-5:]}")
     
-    builder = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN)
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .rate_limiter(PriorityRateLimiter())
+    )
     
     # إذا تم توفير Webhook URL، قم بتكوينه
     if webhook_url:
@@ -81,6 +99,12 @@ async def build_application(webhook_url: Optional[str] = None) -> Application:
     # تسجيل معالجات البوت
     register_handlers(_application)
     
+    # تسجيل المهام المجدولة
+    register_jobs(_application)
+    
+    # تهيئة التطبيق قبل استخدام واجهة البوت
+    await _application.initialize()
+    
     # تعيين الويب هوك بعد إنشاء التطبيق
     if webhook_url:
         bot = _application.bot
@@ -103,6 +127,22 @@ def get_bot_instance() -> Application:
     """
     return _application
 
+async def shutdown_application() -> None:
+    """
+    إيقاف تطبيق البوت وتحرير موارده
+    """
+    global _application
+    
+    if not _application:
+        return
+    
+    if _application.running:
+        await _application.stop()
+    await _application.shutdown()
+    await close_twilio_client()
+    await close_ai_clients()
+    _application = None
+
 def register_handlers(application: Application) -> None:
     """
     تسجيل جميع معالجات البوت
@@ -135,6 +175,47 @@ def register_handlers(application: Application) -> None:
     
     logger.info("All handlers registered successfully")
 
+def register_jobs(application: Application) -> None:
+    """
+    تسجيل المهام المجدولة في JobQueue
+    
+    المعلمات:
+        application: تطبيق البوت
+    """
+    job_queue = application.job_queue
+    
+    if job_queue is None:
+        logger.warning("JobQueue is not available, scheduled reminders are disabled. "
+                       "Install python-telegram-bot[job-queue] to enable them.")
+        return
+    
+    # فحص التذكيرات المستحقة وإرسالها بشكل دوري
+    job_queue.run_repeating(
+        check_for_reminders,
+        interval=REMINDER_CHECK_INTERVAL,
+        first=REMINDER_CHECK_INTERVAL,
+        name="check_for_reminders",
+    )
+    
+    # إرسال الرسائل المستحقة في صندوق الرسائل الصادرة، بما فيها إعادة المحاولات
+    job_queue.run_repeating(
+        drain_outbox,
+        interval=OUTBOX_DRAIN_INTERVAL,
+        first=OUTBOX_DRAIN_INTERVAL,
+        name="drain_outbox",
+    )
+    
+    # حذف سجلات المحادثة الذكية الخاملة من الذاكرة
+    job_queue.run_repeating(
+        expire_ai_conversations,
+        interval=AI_MEMORY_IDLE_TIMEOUT,
+        first=AI_MEMORY_IDLE_TIMEOUT,
+        name="expire_ai_conversations",
+    )
+    
+    logger.info(f"Reminder job scheduled every {REMINDER_CHECK_INTERVAL} seconds, "
+                f"outbox drained every {OUTBOX_DRAIN_INTERVAL} seconds")
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     معالج الأخطاء للبوت
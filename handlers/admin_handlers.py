@@ -4,7 +4,6 @@
 
 import logging
 import os
-import uuid
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Union, Tuple
@@ -35,6 +34,9 @@ from utils.database import (
     get_templates,
     update_template,
 )
+from utils.image_store import store_image
+from utils.phones import normalize_phone
+from utils.telegram_media import send_notification_photo, send_notification_photos
 
 # معرّفات حالات المحادثة
 (
@@ -57,7 +59,9 @@ logger = logging.getLogger(__name__)
 
 # المجلد الحالي
 current_dir = Path(__file__).parent.parent.absolute()
-IMAGES_DIR = current_dir / "data" / "images"
+
+# الحد الأقصى لعدد نتائج البحث بالاسم المعروضة (رسالة تيليجرام لا تتسع لأكثر من ذلك)
+MAX_NAME_SEARCH_RESULTS = 20
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """معالجة أمر البدء /start"""
@@ -177,23 +181,8 @@ async def received_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """معالجة رقم الهاتف المستلم"""
     phone_number = update.message.text
     
-    # تنسيق رقم الهاتف وإضافة رمز البلد إذا لزم الأمر
-    # تحقق من وجود رمز البلد
-    if phone_number.startswith("+"):
-        # الرقم يحتوي على رمز البلد بالفعل
-        pass
-    elif phone_number.startswith("09") or phone_number.startswith("9"):
-        # إضافة رمز البلد لسوريا
-        if phone_number.startswith("0"):
-            phone_number = "+963" + phone_number[1:]
-        else:
-            phone_number = "+963" + phone_number
-    elif phone_number.startswith("05") or phone_number.startswith("5"):
-        # إضافة رمز البلد لتركيا
-        if phone_number.startswith("0"):
-            phone_number = "+90" + phone_number[1:]
-        else:
-            phone_number = "+90" + phone_number
+    # تنسيق رقم الهاتف بصيغة موحدة وإضافة رمز البلد إذا لزم الأمر
+    phone_number = normalize_phone(phone_number) or phone_number
     
     context.user_data["phone_number"] = phone_number
     
@@ -211,14 +200,12 @@ async def received_image(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # إنشاء معرّف فريد للصورة
     file_id = photo.file_id
     
-    # تحميل الصورة
-    IMAGES_DIR.mkdir(exist_ok=True, parents=True)
+    # تحميل الصورة وحفظها في المخزن (تُنشأ النسخ المصغرة في الخلفية)
     file = await context.bot.get_file(file_id)
-    image_uuid = str(uuid.uuid4())
-    image_path = f"data/images/{image_uuid}.jpg"
-    await file.download_to_drive(f"{current_dir}/{image_path}")
+    image_path = await store_image(bytes(await file.download_as_bytearray()))
     
     context.user_data["image_path"] = image_path
+    context.user_data["telegram_file_id"] = file_id
     
     # طلب عدد أيام التذكير
     await update.message.reply_text(
@@ -242,6 +229,7 @@ async def received_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
             phone_number=context.user_data["phone_number"],
             image_path=context.user_data["image_path"],
             reminder_days=days,
+            telegram_file_id=context.user_data.get("telegram_file_id"),
         )
         
         # إرسال رسالة تأكيد
@@ -254,12 +242,12 @@ async def received_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         )
         
         # إرسال صورة الإشعار المضافة
-        with open(f"{current_dir}/{notification['image_path']}", "rb") as image_file:
-            await context.bot.send_photo(
-                chat_id=update.effective_chat.id,
-                photo=image_file,
-                caption=f"صورة الإشعار لـ {notification['customer_name']}"
-            )
+        await send_notification_photo(
+            context.bot,
+            update.effective_chat.id,
+            notification,
+            caption=f"صورة الإشعار لـ {notification['customer_name']}"
+        )
         
         # مسح بيانات المستخدم
         context.user_data.clear()
@@ -813,8 +801,10 @@ async def process_search_name(update: Update, context: ContextTypes.DEFAULT_TYPE
     """معالجة البحث عن إشعار بواسطة اسم العميل"""
     search_name = update.message.text
     
-    # البحث عن الإشعارات
-    results = search_notifications_by_name(search_name)
+    # البحث عن الإشعارات (نتيجة إضافية لمعرفة ما إذا كانت هناك نتائج أكثر مما يُعرض)
+    results = search_notifications_by_name(search_name, limit=MAX_NAME_SEARCH_RESULTS + 1)
+    has_more = len(results) > MAX_NAME_SEARCH_RESULTS
+    results = results[:MAX_NAME_SEARCH_RESULTS]
     
     if not results:
         await update.message.reply_text(
@@ -824,7 +814,10 @@ async def process_search_name(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # عرض نتائج البحث
-    message = f"تم العثور على {len(results)} إشعارات تطابق الاسم '{search_name}':\n\n"
+    if has_more:
+        message = f"أفضل {len(results)} إشعارات تطابق الاسم '{search_name}' (يوجد المزيد، حدد الاسم أكثر لتضييق النتائج):\n\n"
+    else:
+        message = f"تم العثور على {len(results)} إشعارات تطابق الاسم '{search_name}':\n\n"
     
     for i, notification in enumerate(results, start=1):
         message += f"{i}. {notification['customer_name']} - {notification['phone_number']}\n"
@@ -847,18 +840,19 @@ async def process_search_name(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     await update.message.reply_text(message, reply_markup=reply_markup)
     
-    # إرسال صور الإشعارات
-    for notification in results:
-        try:
-            with open(f"{current_dir}/{notification['image_path']}", "rb") as image_file:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=image_file,
-                    caption=f"صورة الإشعار لـ {notification['customer_name']} ({notification['id'][:8]})"
-                )
-        except Exception as e:
-            logger.error(f"Error sending notification image: {e}")
-            await update.message.reply_text(f"حدث خطأ أثناء إرسال صورة الإشعار {notification['id'][:8]}")
+    # إرسال صور الإشعارات في ألبومات
+    try:
+        await send_notification_photos(
+            context.bot,
+            update.effective_chat.id,
+            [
+                (notification, f"صورة الإشعار لـ {notification['customer_name']} ({notification['id'][:8]})")
+                for notification in results
+            ]
+        )
+    except Exception as e:
+        logger.error(f"Error sending notification images: {e}")
+        await update.message.reply_text("حدث خطأ أثناء إرسال صور الإشعارات")
 
 async def process_search_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """معالجة البحث عن إشعار بواسطة رقم الهاتف"""
@@ -901,18 +895,19 @@ async def process_search_phone(update: Update, context: ContextTypes.DEFAULT_TYP
     
     await update.message.reply_text(message, reply_markup=reply_markup)
     
-    # إرسال صور الإشعارات
-    for notification in results:
-        try:
-            with open(f"{current_dir}/{notification['image_path']}", "rb") as image_file:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=image_file,
-                    caption=f"صورة الإشعار لـ {notification['customer_name']} ({notification['id'][:8]})"
-                )
-        except Exception as e:
-            logger.error(f"Error sending notification image: {e}")
-            await update.message.reply_text(f"حدث خطأ أثناء إرسال صورة الإشعار {notification['id'][:8]}")
+    # إرسال صور الإشعارات في ألبومات
+    try:
+        await send_notification_photos(
+            context.bot,
+            update.effective_chat.id,
+            [
+                (notification, f"صورة الإشعار لـ {notification['customer_name']} ({notification['id'][:8]})")
+                for notification in results
+            ]
+        )
+    except Exception as e:
+        logger.error(f"Error sending notification images: {e}")
+        await update.message.reply_text("حدث خطأ أثناء إرسال صور الإشعارات")
 
 def get_admin_handlers() -> List[Any]:
     """
@@ -2,14 +2,17 @@
 معالجات الذكاء الاصطناعي - تدير تفاعلات الذكاء الاصطناعي
 """
 
+import asyncio
+import base64
+import hashlib
 import logging
 import os
-import re
-import uuid
+import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple, Union
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple, Union
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     CommandHandler,
     MessageHandler,
@@ -19,19 +22,31 @@ from telegram.ext import (
     ContextTypes,
 )
 
-from utils.database import is_admin, search_notifications_by_phone, add_notification
+from utils.database import (
+    is_admin,
+    search_notifications_by_phone,
+    add_notification,
+    get_cached_image_analysis,
+    cache_image_analysis,
+)
+from utils.ai_router import AIRouter, AI_ROUTING_MODE
+from utils.conversation_memory import ConversationMemory
+from utils.extraction import extract_shipping_info, extract_phone_numbers
+from utils.image_prep import prepare_image, record_vision_call, get_vision_stats
+from utils.image_store import store_image_file
+from utils.telegram_media import send_notification_photos
 
 # التحقق مما إذا كانت مكتبات الذكاء الاصطناعي متاحة
 try:
     import openai
-    from openai import OpenAI
+    from openai import AsyncOpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
 
 try:
     import anthropic
-    from anthropic import Anthropic
+    from anthropic import AsyncAnthropic
     ANTHROPIC_AVAILABLE = True
 except ImportError:
     ANTHROPIC_AVAILABLE = False
@@ -52,6 +67,41 @@ TEMP_MEDIA_DIR.mkdir(exist_ok=True, parents=True)
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 
+# رسائل فشل تحليل الصور
+IMAGE_ANALYSIS_FAILED_MESSAGE = "عذراً، لم أتمكن من تحليل الصورة. الرجاء التأكد من أن الصورة واضحة ومقروءة."
+IMAGE_ANALYSIS_ERROR_MESSAGE = "عذراً، حدث خطأ أثناء تحليل الصورة. الرجاء المحاولة مرة أخرى لاحقاً."
+
+# مهلة طلبات الذكاء الاصطناعي بالثواني وعدد إعادة المحاولات عند أخطاء الشبكة
+AI_REQUEST_TIMEOUT = float(os.environ.get("AI_REQUEST_TIMEOUT", 60))
+AI_MAX_RETRIES = int(os.environ.get("AI_MAX_RETRIES", 2))
+
+# مهلة التحوط بالثواني قبل توفر قياسات p95 كافية: بعدها يُرسل الطلب إلى المزود التالي
+AI_CHAT_HEDGE_DELAY = float(os.environ.get("AI_CHAT_HEDGE_DELAY", 6))
+AI_VISION_HEDGE_DELAY = float(os.environ.get("AI_VISION_HEDGE_DELAY", 12))
+
+# موجهات الطلبات بين المزودين (قياسات زمن الاستجابة مستقلة لكل نوع طلب)
+chat_router = AIRouter("chat", hedge_delay=AI_CHAT_HEDGE_DELAY)
+vision_router = AIRouter("vision", hedge_delay=AI_VISION_HEDGE_DELAY)
+
+# بث ردود المحادثة بتعديل رسالة واحدة تدريجياً بدلاً من انتظار الرد كاملاً،
+# مع حد أدنى بالثواني بين التعديلات احتراماً لحدود تيليجرام
+AI_STREAM_REPLIES = os.environ.get("AI_STREAM_REPLIES", "true").lower() in ("1", "true", "yes")
+AI_STREAM_EDIT_INTERVAL = float(os.environ.get("AI_STREAM_EDIT_INTERVAL", 1))
+
+# مؤشر يُلحق بالرد أثناء البث، والحد الأقصى لطول رسالة تيليجرام
+STREAM_CURSOR = " ▌"
+MAX_MESSAGE_LENGTH = 4096
+
+# بادئة ملخص الرسائل السابقة عند إرساله إلى النموذج
+SUMMARY_PREFIX = "ملخص ما سبق من المحادثة مع المستخدم:\n"
+
+# رسالة فشل توليد الرد
+CHAT_RESPONSE_ERROR_MESSAGE = "عذراً، حدث خطأ أثناء توليد الرد. الرجاء المحاولة مرة أخرى لاحقاً."
+
+# عملاء الذكاء الاصطناعي المشتركون على مستوى العملية (يعيدون استخدام الاتصالات)
+_openai_client = None
+_anthropic_client = None
+
 # معرّفات حالات المحادثة
 (
     WAITING_FOR_CHAT,
@@ -70,33 +120,59 @@ def is_ai_available() -> bool:
 
 def get_openai_client() -> Optional[Any]:
     """
-    الحصول على عميل OpenAI
+    الحصول على عميل OpenAI غير المتزامن المشترك، وإنشاؤه عند أول استخدام
     
     العائد:
         عميل OpenAI إذا كان متاحاً، None خلاف ذلك
     """
-    if OPENAI_AVAILABLE and OPENAI_API_KEY:
+    global _openai_client
+    
+    if _openai_client is None and OPENAI_AVAILABLE and OPENAI_API_KEY:
         try:
-            return OpenAI(api_key=OPENAI_API_KEY)
+            _openai_client = AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                timeout=AI_REQUEST_TIMEOUT,
+                max_retries=AI_MAX_RETRIES,
+            )
         except Exception as e:
             logger.error(f"حدث خطأ أثناء إنشاء عميل OpenAI: {e}")
     
-    return None
+    return _openai_client
 
 def get_anthropic_client() -> Optional[Any]:
     """
-    الحصول على عميل Anthropic
+    الحصول على عميل Anthropic غير المتزامن المشترك، وإنشاؤه عند أول استخدام
     
     العائد:
         عميل Anthropic إذا كان متاحاً، None خلاف ذلك
     """
-    if ANTHROPIC_AVAILABLE and ANTHROPIC_API_KEY:
+    global _anthropic_client
+    
+    if _anthropic_client is None and ANTHROPIC_AVAILABLE and ANTHROPIC_API_KEY:
         try:
-            return Anthropic(api_key=ANTHROPIC_API_KEY)
+            _anthropic_client = AsyncAnthropic(
+                api_key=ANTHROPIC_API_KEY,
+                timeout=AI_REQUEST_TIMEOUT,
+                max_retries=AI_MAX_RETRIES,
+            )
         except Exception as e:
             logger.error(f"حدث خطأ أثناء إنشاء عميل Anthropic: {e}")
     
-    return None
+    return _anthropic_client
+
+async def close_ai_clients() -> None:
+    """إغلاق عملاء الذكاء الاصطناعي المشتركين وتحرير اتصالاتهم"""
+    global _openai_client, _anthropic_client
+    
+    for client in (_openai_client, _anthropic_client):
+        if client is not None:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.error(f"حدث خطأ أثناء إغلاق عميل الذكاء الاصطناعي: {e}")
+    
+    _openai_client = None
+    _anthropic_client = None
 
 async def ai_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """معالجة أمر الذكاء الاصطناعي /ai"""
@@ -125,7 +201,7 @@ async def ai_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     # تهيئة سياق المحادثة
     context.user_data["ai_mode"] = None
-    context.user_data["ai_messages"] = []
+    context.user_data["ai_messages"] = ConversationMemory()
     
     return WAITING_FOR_CHAT
 
@@ -204,8 +280,8 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_message = update.message.text
     
     # أضف رسالة المستخدم إلى سياق المحادثة
-    messages = context.user_data.get("ai_messages", [])
-    messages.append({"role": "user", "content": user_message})
+    memory = get_conversation_memory(context)
+    memory.add("user", user_message)
     
     # إرسال مؤشر الكتابة
     await context.bot.send_chat_action(
@@ -234,36 +310,122 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             ai_response = f"أرى أنك تبحث عن معلومات مرتبطة برقم هاتف. {notification_info}"
             await update.message.reply_text(ai_response)
             
-            # إرسال صور الإشعارات
-            for notification in results:
-                try:
-                    with open(f"{current_dir}/{notification['image_path']}", "rb") as image_file:
-                        await context.bot.send_photo(
-                            chat_id=update.effective_chat.id,
-                            photo=image_file,
-                            caption=f"صورة الإشعار لـ {notification['customer_name']} ({notification['id'][:8]})"
-                        )
-                except Exception as e:
-                    logger.error(f"حدث خطأ أثناء إرسال صورة الإشعار: {e}")
+            # إرسال صور الإشعارات في ألبومات
+            try:
+                await send_notification_photos(
+                    context.bot,
+                    update.effective_chat.id,
+                    [
+                        (notification, f"صورة الإشعار لـ {notification['customer_name']} ({notification['id'][:8]})")
+                        for notification in results
+                    ]
+                )
+            except Exception as e:
+                logger.error(f"حدث خطأ أثناء إرسال صور الإشعارات: {e}")
             
             # أضف رد الذكاء الاصطناعي إلى سياق المحادثة
-            messages.append({"role": "assistant", "content": ai_response})
-            context.user_data["ai_messages"] = messages
+            memory.add("assistant", ai_response)
             
             return WAITING_FOR_CHAT
     
-    # استخدام الذكاء الاصطناعي للرد
-    ai_response = await generate_ai_response(user_message, messages)
-    
-    # إرسال رد الذكاء الاصطناعي
-    await update.message.reply_text(ai_response)
+    # استخدام الذكاء الاصطناعي للرد (أحدث الرسائل ضمن ميزانية الرموز فقط)
+    messages, summary = memory.prompt()
+    if AI_STREAM_REPLIES:
+        ai_response = await stream_ai_response(update, messages, summary)
+    else:
+        ai_response = await generate_ai_response(user_message, messages, summary)
+        
+        # إرسال رد الذكاء الاصطناعي
+        await update.message.reply_text(ai_response)
     
     # أضف رد الذكاء الاصطناعي إلى سياق المحادثة
-    messages.append({"role": "assistant", "content": ai_response})
-    context.user_data["ai_messages"] = messages
+    memory.add("assistant", ai_response)
+    
+    # تلخيص الرسائل التي خرجت من السجل في الخلفية حتى لا تنتظر رسالة المستخدم التالية طلب التلخيص
+    if memory.needs_summary():
+        context.application.create_task(summarize_conversation(memory), update=update)
     
     return WAITING_FOR_CHAT
 
+def get_conversation_memory(context: ContextTypes.DEFAULT_TYPE) -> ConversationMemory:
+    """
+    الحصول على سجل المحادثة الذكية للمستخدم، وإنشاء سجل جديد إذا لم يوجد أو انتهت صلاحيته
+    
+    المعلمات:
+        context: سياق المحادثة
+        
+    العائد:
+        سجل المحادثة
+    """
+    memory = context.user_data.get("ai_messages")
+    if not isinstance(memory, ConversationMemory) or memory.is_expired():
+        memory = context.user_data["ai_messages"] = ConversationMemory()
+    return memory
+
+async def summarize_conversation(memory: ConversationMemory) -> None:
+    """
+    دمج الرسائل التي خرجت من سجل المحادثة في ملخص المحادثة
+    
+    تُنفذ كمهمة في الخلفية؛ إذا فشل التلخيص تُعاد الرسائل إلى قائمة الانتظار
+    لتُلخص مع الرسائل التالية.
+    
+    المعلمات:
+        memory: سجل المحادثة
+    """
+    memory.summarizing = True
+    turns = memory.take_evicted()
+    transcript = "\n".join(
+        f"{'المستخدم' if turn['role'] == 'user' else 'المساعد'}: {turn['content']}"
+        for turn in turns
+    )
+    
+    prompt = (
+        "لخص المحادثة التالية في فقرة قصيرة، مع الحفاظ على أسماء العملاء وأرقام الهواتف "
+        "ورموز الإشعارات والطلبات المهمة.\n\n"
+    )
+    if memory.summary:
+        prompt += f"الملخص السابق:\n{memory.summary}\n\n"
+    prompt += f"المحادثة:\n{transcript}"
+    
+    messages = [{"role": "user", "content": prompt}]
+    calls = {}
+    if get_openai_client():
+        calls["openai"] = lambda: _openai_chat(messages)
+    if get_anthropic_client():
+        calls["anthropic"] = lambda: _anthropic_chat(messages)
+    
+    try:
+        summary = await chat_router.run(calls)
+    except Exception as e:
+        logger.error(f"حدث خطأ أثناء تلخيص المحادثة: {e}")
+        summary = None
+    finally:
+        memory.summarizing = False
+    
+    if summary:
+        memory.set_summary(summary)
+    else:
+        memory.restore_evicted(turns)
+
+async def expire_ai_conversations(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    حذف سجلات المحادثة الذكية الخاملة من ذاكرة البوت
+    
+    المعلمات:
+        context: سياق المهمة المجدولة
+    """
+    now = time.time()
+    expired = 0
+    
+    for user_data in context.application.user_data.values():
+        memory = user_data.get("ai_messages")
+        if isinstance(memory, ConversationMemory) and memory.is_expired(now):
+            del user_data["ai_messages"]
+            expired += 1
+    
+    if expired:
+        logger.info(f"Expired {expired} idle AI conversations")
+
 async def handle_image_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """معالجة رسائل تحليل الصور"""
     if context.user_data.get("ai_mode") != "image":
@@ -290,24 +452,15 @@ async def handle_image_message(update: Update, context: ContextTypes.DEFAULT_TYP
         action="typing"
     )
     
-    # تحليل الصورة باستخدام الذكاء الاصطناعي
-    analysis_result = await analyze_image(f"{current_dir}/{temp_image_path}")
-    
-    # استخراج المعلومات المهمة
-    extracted_data = extract_shipping_info(analysis_result)
+    # تحليل الصورة واستخراج المعلومات المهمة (تُعاد النتيجة المحفوظة للصور المكررة)
+    analysis_result, extracted_data = await analyze_shipping_image(f"{current_dir}/{temp_image_path}")
     
     # حفظ البيانات المستخرجة
     context.user_data["extracted_data"] = extracted_data
     
-    # إنشاء نسخة دائمة من الصورة
+    # إنشاء نسخة دائمة من الصورة في مخزن الصور
     if extracted_data.get("customer_name") and extracted_data.get("phone_number"):
-        IMAGES_DIR.mkdir(exist_ok=True, parents=True)
-        image_uuid = str(uuid.uuid4())
-        image_path = f"data/images/{image_uuid}.jpg"
-        
-        # نسخ الصورة من المجلد المؤقت إلى مجلد الصور
-        import shutil
-        shutil.copy(f"{current_dir}/{temp_image_path}", f"{current_dir}/{image_path}")
+        image_path = await store_image_file(f"{current_dir}/{temp_image_path}")
         
         # حفظ مسار الصورة الدائم
         context.user_data["image_path"] = image_path
@@ -373,63 +526,164 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     return ConversationHandler.END
 
-async def generate_ai_response(user_message: str, messages: List[Dict[str, str]]) -> str:
+async def generate_ai_response(user_message: str, messages: List[Dict[str, str]],
+                               summary: Optional[str] = None) -> str:
     """
     توليد رد باستخدام الذكاء الاصطناعي
     
+    يُوجَّه الطلب بين المزودين المتاحين عبر chat_router (تحوط، قاطع دائرة).
+    
     المعلمات:
         user_message: رسالة المستخدم
         messages: سجل المحادثة
+        summary: ملخص الرسائل السابقة (اختياري)
         
     العائد:
         رد الذكاء الاصطناعي
     """
     try:
-        # محاولة استخدام OpenAI أولاً
-        openai_client = get_openai_client()
-        if openai_client:
-            try:
-                # تحويل المحادثة إلى تنسيق OpenAI
-                openai_messages = [{"role": msg["role"], "content": msg["content"]} for msg in messages[-5:]]
-                
-                response = openai_client.chat.completions.create(
-                    model="gpt-4o",  # استخدام أحدث نموذج
-                    messages=openai_messages,
-                    max_tokens=500,
-                    temperature=0.7
-                )
-                
-                return response.choices[0].message.content
-            except Exception as e:
-                logger.error(f"حدث خطأ أثناء استخدام OpenAI: {e}")
+        calls = {}
+        if get_openai_client():
+            calls["openai"] = lambda: _openai_chat(messages, summary)
+        if get_anthropic_client():
+            calls["anthropic"] = lambda: _anthropic_chat(messages, summary)
         
-        # إذا فشل OpenAI، جرب Anthropic
-        anthropic_client = get_anthropic_client()
-        if anthropic_client:
-            try:
-                # تحويل المحادثة إلى تنسيق Anthropic
-                anthropic_messages = []
-                for msg in messages[-5:]:
-                    anthropic_messages.append({"role": msg["role"], "content": msg["content"]})
-                
-                response = anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",  # استخدام أحدث نموذج
-                    max_tokens=500,
-                    temperature=0.7,
-                    messages=anthropic_messages
-                )
-                
-                return response.content[0].text
-            except Exception as e:
-                logger.error(f"حدث خطأ أثناء استخدام Anthropic: {e}")
+        response = await chat_router.run(calls)
+        if response:
+            return response
         
         # إذا فشلت جميع المحاولات، أرجع رسالة افتراضية
-        return "عذراً، حدث خطأ أثناء توليد الرد. الرجاء المحاولة مرة أخرى لاحقاً."
+        return CHAT_RESPONSE_ERROR_MESSAGE
     
     except Exception as e:
         logger.error(f"حدث خطأ عام أثناء توليد رد الذكاء الاصطناعي: {e}")
         return "عذراً، حدث خطأ أثناء معالجة طلبك. الرجاء المحاولة مرة أخرى لاحقاً."
 
+def _openai_chat_params(messages: List[Dict[str, str]], summary: Optional[str]) -> Dict[str, Any]:
+    """معلمات طلب محادثة OpenAI، مع ملخص الرسائل السابقة كرسالة نظام"""
+    # تحويل المحادثة إلى تنسيق OpenAI
+    openai_messages = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+    if summary:
+        openai_messages.insert(0, {"role": "system", "content": SUMMARY_PREFIX + summary})
+    
+    return {
+        "model": "gpt-4o",  # استخدام أحدث نموذج
+        "messages": openai_messages,
+        "max_tokens": 500,
+        "temperature": 0.7,
+    }
+
+def _anthropic_chat_params(messages: List[Dict[str, str]], summary: Optional[str]) -> Dict[str, Any]:
+    """معلمات طلب محادثة Anthropic، مع ملخص الرسائل السابقة كتعليمات نظام"""
+    # تحويل المحادثة إلى تنسيق Anthropic
+    anthropic_messages = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+    
+    params = {
+        "model": "claude-3-5-sonnet-20241022",  # استخدام أحدث نموذج
+        "max_tokens": 500,
+        "temperature": 0.7,
+        "messages": anthropic_messages,
+    }
+    if summary:
+        params["system"] = SUMMARY_PREFIX + summary
+    return params
+
+async def _openai_chat(messages: List[Dict[str, str]], summary: Optional[str] = None) -> Optional[str]:
+    """طلب رد محادثة من OpenAI"""
+    response = await get_openai_client().chat.completions.create(**_openai_chat_params(messages, summary))
+    return response.choices[0].message.content
+
+async def _anthropic_chat(messages: List[Dict[str, str]], summary: Optional[str] = None) -> Optional[str]:
+    """طلب رد محادثة من Anthropic"""
+    response = await get_anthropic_client().messages.create(**_anthropic_chat_params(messages, summary))
+    return response.content[0].text
+
+async def stream_ai_response(update: Update, messages: List[Dict[str, str]],
+                             summary: Optional[str] = None) -> str:
+    """
+    بث رد الذكاء الاصطناعي إلى المستخدم
+    
+    تُرسل الرسالة عند وصول أول جزء من النص ثم تُعدَّل كلما مرت
+    AI_STREAM_EDIT_INTERVAL ثانية، ويُثبَّت النص الكامل في تعديل أخير.
+    
+    المعلمات:
+        update: التحديث الذي يحتوي على رسالة المستخدم
+        messages: سجل المحادثة
+        summary: ملخص الرسائل السابقة (اختياري)
+        
+    العائد:
+        النص الكامل للرد
+    """
+    calls = {}
+    if get_openai_client():
+        calls["openai"] = lambda: _openai_chat_stream(messages, summary)
+    if get_anthropic_client():
+        calls["anthropic"] = lambda: _anthropic_chat_stream(messages, summary)
+    
+    reply = None
+    text = ""
+    last_edit = 0.0
+    stream = chat_router.stream(calls)
+    
+    try:
+        async for chunk in stream:
+            text += chunk
+            if len(text) >= MAX_MESSAGE_LENGTH:
+                break
+            
+            # النص المعروض مع المؤشر يجب ألا يتجاوز حد طول الرسالة
+            preview = text[:MAX_MESSAGE_LENGTH - len(STREAM_CURSOR)] + STREAM_CURSOR
+            now = time.monotonic()
+            if reply is None:
+                reply = await update.message.reply_text(preview)
+                last_edit = now
+            elif now - last_edit >= AI_STREAM_EDIT_INTERVAL:
+                await _edit_reply(reply, preview)
+                last_edit = now
+    except Exception as e:
+        logger.error(f"حدث خطأ أثناء بث رد الذكاء الاصطناعي: {e}")
+    finally:
+        # إغلاق البث صراحة حتى يُغلق اتصال المزود فور التوقف المبكر دون انتظار جامع القمامة
+        await stream.aclose()
+    
+    text = text[:MAX_MESSAGE_LENGTH] or CHAT_RESPONSE_ERROR_MESSAGE
+    
+    # تثبيت النص النهائي
+    if reply is None:
+        await update.message.reply_text(text)
+    else:
+        await _edit_reply(reply, text)
+    
+    return text
+
+async def _edit_reply(reply: Any, text: str) -> None:
+    """تعديل رسالة الرد، مع تجاهل حالة عدم تغير النص"""
+    try:
+        await reply.edit_text(text)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            logger.error(f"حدث خطأ أثناء تعديل رسالة الرد: {e}")
+
+async def _openai_chat_stream(messages: List[Dict[str, str]], summary: Optional[str] = None) -> AsyncIterator[str]:
+    """بث رد محادثة من OpenAI"""
+    stream = await get_openai_client().chat.completions.create(
+        **_openai_chat_params(messages, summary),
+        stream=True
+    )
+    
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+
+async def _anthropic_chat_stream(messages: List[Dict[str, str]], summary: Optional[str] = None) -> AsyncIterator[str]:
+    """بث رد محادثة من Anthropic"""
+    async with get_anthropic_client().messages.stream(**_anthropic_chat_params(messages, summary)) as stream:
+        async for text in stream.text_stream:
+            yield text
+
 async def analyze_image(image_path: str) -> str:
     """
     تحليل صورة باستخدام الذكاء الاصطناعي
@@ -441,269 +695,220 @@ async def analyze_image(image_path: str) -> str:
         نتيجة التحليل
     """
     try:
-        # محاولة استخدام OpenAI Vision أولاً
-        openai_client = get_openai_client()
-        if openai_client:
-            try:
-                import base64
-                
-                # تحويل الصورة إلى base64
-                with open(image_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                
-                response = openai_client.chat.completions.create(
-                    model="gpt-4o",  # استخدام أحدث نموذج
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": (
-                                "أنت محلل شحنات خبير. قم بتحليل صورة الشحنة واستخراج المعلومات المهمة التالية:\n"
-                                "1. اسم العميل\n"
-                                "2. رقم الهاتف\n"
-                                "3. تاريخ الشحن\n"
-                                "4. وجهة الشحنة\n"
-                                "5. قيمة الشحنة\n\n"
-                                "قدم تحليلاً مفصلاً لمحتوى الصورة. ركز على المعلومات المتعلقة بالشحنة."
-                            )
-                        },
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": "قم بتحليل هذه الصورة وحدد اسم العميل ورقم الهاتف وتاريخ الشحن والوجهة والقيمة إن وجدت."
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=1000
-                )
-                
-                return response.choices[0].message.content
-            except Exception as e:
-                logger.error(f"حدث خطأ أثناء استخدام OpenAI Vision: {e}")
-        
-        # إذا فشل OpenAI، جرب Anthropic
-        anthropic_client = get_anthropic_client()
-        if anthropic_client:
-            try:
-                import base64
-                
-                # تحويل الصورة إلى base64
-                with open(image_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                
-                response = anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",  # استخدام أحدث نموذج
-                    max_tokens=1000,
-                    temperature=0.7,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": (
-                                        "أنت محلل شحنات خبير. قم بتحليل صورة الشحنة واستخراج المعلومات المهمة التالية:\n"
-                                        "1. اسم العميل\n"
-                                        "2. رقم الهاتف\n"
-                                        "3. تاريخ الشحن\n"
-                                        "4. وجهة الشحنة\n"
-                                        "5. قيمة الشحنة\n\n"
-                                        "قدم تحليلاً مفصلاً لمحتوى الصورة. ركز على المعلومات المتعلقة بالشحنة."
-                                    )
-                                },
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": "image/jpeg",
-                                        "data": base64_image
-                                    }
-                                }
-                            ]
-                        }
-                    ]
-                )
-                
-                return response.content[0].text
-            except Exception as e:
-                logger.error(f"حدث خطأ أثناء استخدام Anthropic: {e}")
+        analysis = await _request_image_analysis(image_path)
+        if analysis:
+            return analysis
         
         # إذا فشلت جميع المحاولات، أرجع رسالة افتراضية
-        return "عذراً، لم أتمكن من تحليل الصورة. الرجاء التأكد من أن الصورة واضحة ومقروءة."
+        return IMAGE_ANALYSIS_FAILED_MESSAGE
     
     except Exception as e:
         logger.error(f"حدث خطأ عام أثناء تحليل الصورة: {e}")
-        return "عذراً، حدث خطأ أثناء تحليل الصورة. الرجاء المحاولة مرة أخرى لاحقاً."
+        return IMAGE_ANALYSIS_ERROR_MESSAGE
 
-def extract_shipping_info(analysis_text: str) -> Dict[str, str]:
+async def analyze_shipping_image(image_path: str) -> Tuple[str, Dict[str, str]]:
     """
-    استخراج معلومات الشحنة من نص التحليل
+    تحليل صورة شحنة واستخراج معلوماتها، مع ذاكرة مؤقتة حسب محتوى الصورة
+    
+    تُحسب بصمة SHA-256 لمحتوى الصورة، فإذا سبق تحليل نفس الصورة تُعاد النتيجة
+    المحفوظة دون استدعاء نموذج الرؤية. النتائج الناجحة فقط تُحفظ.
     
     المعلمات:
-        analysis_text: نص التحليل
+        image_path: مسار الصورة
         
     العائد:
-        قاموس يحتوي على المعلومات المستخرجة
+        زوج (نص التحليل، المعلومات المستخرجة)
     """
-    extracted_data = {}
-    
-    # أنماط التعرف على البيانات
-    name_patterns = [
-        r"اسم العميل:?\s*([^\n:;,،]+)",
-        r"اسم المستلم:?\s*([^\n:;,،]+)",
-        r"العميل:?\s*([^\n:;,،]+)",
-        r"المستلم:?\s*([^\n:;,،]+)",
-        r"اسم:?\s*([^\n:;,،]+)",
-    ]
-    
-    phone_patterns = [
-        r"رقم الهاتف:?\s*([+\d\s\-()]+)",
-        r"الهاتف:?\s*([+\d\s\-()]+)",
-        r"رقم الجوال:?\s*([+\d\s\-()]+)",
-        r"الجوال:?\s*([+\d\s\-()]+)",
-        r"رقم:?\s*([+\d\s\-()]+)",
-        r"(\+?90\d{10})",
-        r"(\+?963\d{9})",
-        r"(\d{10,11})",
-    ]
+    try:
+        image_hash = await asyncio.to_thread(_hash_file, image_path)
+    except OSError as e:
+        logger.error(f"حدث خطأ أثناء قراءة الصورة: {e}")
+        image_hash = None
     
-    date_patterns = [
-        r"تاريخ الشحن:?\s*([^\n:;,،]+)",
-        r"تاريخ:?\s*([^\n:;,،]+)",
-        r"(\d{4}-\d{2}-\d{2})",
-        r"(\d{2}/\d{2}/\d{4})",
-        r"(\d{2}-\d{2}-\d{4})",
-    ]
+    if image_hash:
+        cached = get_cached_image_analysis(image_hash)
+        if cached:
+            logger.info(f"تم استخدام تحليل محفوظ للصورة {image_hash[:12]}")
+            return cached
     
-    destination_patterns = [
-        r"وجهة الشحنة:?\s*([^\n:;,،]+)",
-        r"الوجهة:?\s*([^\n:;,،]+)",
-        r"المدينة:?\s*([^\n:;,،]+)",
-        r"العنوان:?\s*([^\n:;,،]+)",
-        r"مدينة:?\s*([^\n:;,،]+)",
-    ]
+    try:
+        analysis = await _request_image_analysis(image_path)
+    except Exception as e:
+        logger.error(f"حدث خطأ عام أثناء تحليل الصورة: {e}")
+        analysis = None
     
-    value_patterns = [
-        r"قيمة الشحنة:?\s*([^\n:;,،]+)",
-        r"قيمة:?\s*([^\n:;,،]+)",
-        r"المبلغ:?\s*([^\n:;,،]+)",
-        r"السعر:?\s*([^\n:;,،]+)",
-        r"(\d+(?:,\d+)*(?:\.\d+)?\s*(?:ليرة|ل\.س|دولار|\$|TL|₺))",
-    ]
+    if not analysis:
+        return IMAGE_ANALYSIS_FAILED_MESSAGE, {}
     
-    # اسم العميل
-    for pattern in name_patterns:
-        matches = re.search(pattern, analysis_text, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            customer_name = matches.group(1).strip()
-            if 3 <= len(customer_name) <= 50:  # التحقق من أن الاسم منطقي
-                extracted_data["customer_name"] = customer_name
-                break
+    extracted_data = extract_shipping_info(analysis)
+    if image_hash:
+        cache_image_analysis(image_hash, analysis, extracted_data)
     
-    # رقم الهاتف
-    for pattern in phone_patterns:
-        matches = re.search(pattern, analysis_text, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            phone_number = matches.group(1).strip()
-            # تنظيف رقم الهاتف
-            phone_number = ''.join(filter(lambda x: x.isdigit() or x == '+', phone_number))
-            
-            # إضافة رمز البلد إذا لزم الأمر
-            if phone_number.startswith("09") or phone_number.startswith("9"):
-                # إضافة رمز البلد لسوريا
-                if phone_number.startswith("0"):
-                    phone_number = "+963" + phone_number[1:]
-                else:
-                    phone_number = "+963" + phone_number
-            elif phone_number.startswith("05") or phone_number.startswith("5"):
-                # إضافة رمز البلد لتركيا
-                if phone_number.startswith("0"):
-                    phone_number = "+90" + phone_number[1:]
-                else:
-                    phone_number = "+90" + phone_number
-            
-            extracted_data["phone_number"] = phone_number
-            break
-    
-    # تاريخ الشحن
-    for pattern in date_patterns:
-        matches = re.search(pattern, analysis_text, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            shipping_date = matches.group(1).strip()
-            extracted_data["shipping_date"] = shipping_date
-            break
-    
-    # وجهة الشحنة
-    for pattern in destination_patterns:
-        matches = re.search(pattern, analysis_text, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            destination = matches.group(1).strip()
-            extracted_data["destination"] = destination
-            break
-    
-    # قيمة الشحنة
-    for pattern in value_patterns:
-        matches = re.search(pattern, analysis_text, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            value = matches.group(1).strip()
-            extracted_data["value"] = value
-            break
-    
-    return extracted_data
-
-def extract_phone_numbers(text: str) -> List[str]:
+    return analysis, extracted_data
+
+def _hash_file(path: str) -> str:
+    """حساب بصمة SHA-256 لمحتوى ملف"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def _request_image_analysis(image_path: str) -> Optional[str]:
     """
-    استخراج أرقام الهواتف من النص
+    طلب تحليل الصورة من مزودي الذكاء الاصطناعي عبر vision_router
     
     المعلمات:
-        text: النص المراد البحث فيه
+        image_path: مسار الصورة
         
     العائد:
-        قائمة بأرقام الهواتف المستخرجة
+        نص التحليل، أو None إذا لم ينجح أي مزود
     """
-    phone_patterns = [
-        r"\+?90\d{10}",  # رقم تركي مع رمز البلد
-        r"\+?963\d{9}",  # رقم سوري مع رمز البلد
-        r"0?9\d{8}",     # رقم سوري بدون رمز البلد
-        r"0?5\d{9}",     # رقم تركي بدون رمز البلد
-        r"\d{10,11}",    # أي رقم هاتف عام
-    ]
+    calls = {}
+    if get_openai_client():
+        calls["openai"] = lambda: _openai_vision(image_path)
+    if get_anthropic_client():
+        calls["anthropic"] = lambda: _anthropic_vision(image_path)
     
-    phone_numbers = []
+    return await vision_router.run(calls)
+
+async def _openai_vision(image_path: str) -> Optional[str]:
+    """طلب تحليل صورة من OpenAI Vision"""
+    # تجهيز الصورة (تصحيح الاتجاه والتصغير والضغط) ثم تحويلها إلى base64
+    image_bytes, prep_info = await prepare_image(image_path, "openai")
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    started = time.perf_counter()
     
-    for pattern in phone_patterns:
-        matches = re.findall(pattern, text)
-        if matches:
-            for match in matches:
-                # تنظيف رقم الهاتف
-                phone_number = ''.join(filter(lambda x: x.isdigit() or x == '+', match))
-                
-                # إضافة رمز البلد إذا لزم الأمر
-                if phone_number.startswith("09") or phone_number.startswith("9"):
-                    # إضافة رمز البلد لسوريا
-                    if phone_number.startswith("0"):
-                        phone_number = "+963" + phone_number[1:]
-                    else:
-                        phone_number = "+963" + phone_number
-                elif phone_number.startswith("05") or phone_number.startswith("5"):
-                    # إضافة رمز البلد لتركيا
-                    if phone_number.startswith("0"):
-                        phone_number = "+90" + phone_number[1:]
-                    else:
-                        phone_number = "+90" + phone_number
-                
-                if phone_number not in phone_numbers:
-                    phone_numbers.append(phone_number)
+    try:
+        response = await get_openai_client().chat.completions.create(
+            model="gpt-4o",  # استخدام أحدث نموذج
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "أنت محلل شحنات خبير. قم بتحليل صورة الشحنة واستخراج المعلومات المهمة التالية:\n"
+                        "1. اسم العميل\n"
+                        "2. رقم الهاتف\n"
+                        "3. تاريخ الشحن\n"
+                        "4. وجهة الشحنة\n"
+                        "5. قيمة الشحنة\n\n"
+                        "قدم تحليلاً مفصلاً لمحتوى الصورة. ركز على المعلومات المتعلقة بالشحنة."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": "قم بتحليل هذه الصورة وحدد اسم العميل ورقم الهاتف وتاريخ الشحن والوجهة والقيمة إن وجدت."
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}"
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=1000
+        )
+    except Exception:
+        record_vision_call("openai", prep_info, time.perf_counter() - started, success=False)
+        raise
     
-    return phone_numbers
+    record_vision_call("openai", prep_info, time.perf_counter() - started, success=True)
+    return response.choices[0].message.content
+
+async def _anthropic_vision(image_path: str) -> Optional[str]:
+    """طلب تحليل صورة من Anthropic"""
+    # تجهيز الصورة (تصحيح الاتجاه والتصغير والضغط) ثم تحويلها إلى base64
+    image_bytes, prep_info = await prepare_image(image_path, "anthropic")
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    started = time.perf_counter()
+    
+    try:
+        response = await get_anthropic_client().messages.create(
+            model="claude-3-5-sonnet-20241022",  # استخدام أحدث نموذج
+            max_tokens=1000,
+            temperature=0.7,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": (
+                                "أنت محلل شحنات خبير. قم بتحليل صورة الشحنة واستخراج المعلومات المهمة التالية:\n"
+                                "1. اسم العميل\n"
+                                "2. رقم الهاتف\n"
+                                "3. تاريخ الشحن\n"
+                                "4. وجهة الشحنة\n"
+                                "5. قيمة الشحنة\n\n"
+                                "قدم تحليلاً مفصلاً لمحتوى الصورة. ركز على المعلومات المتعلقة بالشحنة."
+                            )
+                        },
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/jpeg",
+                                "data": base64_image
+                            }
+                        }
+                    ]
+                }
+            ]
+        )
+    except Exception:
+        record_vision_call("anthropic", prep_info, time.perf_counter() - started, success=False)
+        raise
+    
+    record_vision_call("anthropic", prep_info, time.perf_counter() - started, success=True)
+    return response.content[0].text
+
+async def ai_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """معالجة أمر إحصائيات تحليل الصور /aistats"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(
+            "عذراً، هذا الأمر متاح للمسؤولين فقط."
+        )
+        return
+    
+    stats = get_vision_stats()
+    routers = {"المحادثة": chat_router.stats(), "الرؤية": vision_router.stats()}
+    if not stats and not any(routers.values()):
+        await update.message.reply_text("لم يتم إرسال أي طلبات إلى نماذج الذكاء الاصطناعي منذ بدء التشغيل.")
+        return
+    
+    message = "إحصائيات تحليل الصور منذ بدء التشغيل:\n\n" if stats else ""
+    for provider, provider_stats in stats.items():
+        saved_percent = 0
+        if provider_stats["original_bytes"]:
+            saved_percent = 100 * provider_stats["bytes_saved"] / provider_stats["original_bytes"]
+        
+        message += f"🤖 {provider}\n"
+        message += f"   الطلبات: {provider_stats['calls']} (فشل {provider_stats['failures']})\n"
+        message += f"   الحجم الأصلي: {provider_stats['original_bytes'] / 1024:.0f} KB\n"
+        message += f"   الحجم المرسل: {provider_stats['prepared_bytes'] / 1024:.0f} KB\n"
+        message += f"   التوفير: {provider_stats['bytes_saved'] / 1024:.0f} KB ({saved_percent:.0f}%)\n"
+        message += f"   متوسط زمن التجهيز: {provider_stats['avg_prep_seconds'] * 1000:.0f} ms\n"
+        message += f"   متوسط زمن الطلب: {provider_stats['avg_request_seconds']:.2f} s\n\n"
+    
+    message += f"توجيه الطلبات بين المزودين (الوضع: {AI_ROUTING_MODE}):\n\n"
+    for router_name, router_stats in routers.items():
+        for provider, provider_stats in router_stats.items():
+            p50 = provider_stats["p50"]
+            p95 = provider_stats["p95"]
+            latency = f"p50 {p50:.2f} s، p95 {p95:.2f} s" if p95 is not None else "قياسات غير كافية"
+            circuit = "مفتوح ⛔" if provider_stats["circuit_open"] else "مغلق ✅"
+            
+            message += f"🔀 {router_name} - {provider}\n"
+            message += f"   الطلبات: {provider_stats['calls']} (فشل {provider_stats['failures']})\n"
+            message += f"   زمن الاستجابة: {latency}\n"
+            message += f"   قاطع الدائرة: {circuit}\n\n"
+    
+    await update.message.reply_text(message)
 
 def get_ai_handlers() -> List[Any]:
     """
@@ -745,6 +950,9 @@ def get_ai_handlers() -> List[Any]:
         # معالج المحادثة للذكاء الاصطناعي
         ai_conversation_handler,
         
+        # إحصائيات تحليل الصور للمسؤولين
+        CommandHandler("aistats", ai_stats_command),
+        
         # معالج تحليل الصور المباشر
         # ملاحظة: يجب أن يكون هذا المعالج آخر معالج في القائمة لتجنب التداخل مع المعالجات الأخرى
         # direct_image_handler
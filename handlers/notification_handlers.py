@@ -2,6 +2,7 @@
 معالجات الإشعارات - تدير العمليات المتعلقة بالإشعارات والتذكيرات
 """
 
+import asyncio
 import logging
 import os
 from datetime import datetime
@@ -20,18 +21,20 @@ from utils.database import (
     is_admin,
     get_notifications,
     get_notification,
-    mark_reminder_sent,
     get_pending_reminders,
     get_templates,
     mark_delivery_confirmed,
+    enqueue_outbox_messages,
+    claim_outbox_messages,
+    complete_outbox_message,
+    fail_outbox_message,
+    OUTBOX_LEASE_SECONDS,
 )
-
-# استيراد Twilio إذا كان موجوداً
-try:
-    from twilio.rest import Client
-    TWILIO_AVAILABLE = True
-except ImportError:
-    TWILIO_AVAILABLE = False
+from utils.image_store import rendition_path
+from utils.rate_limiter import PRIORITY_BULK
+from utils.signed_media import is_media_url_available, signed_media_url
+from utils.telegram_media import send_notification_photo
+from utils.twilio_sender import is_twilio_configured, send_twilio_message
 
 # إعداد السجل
 logger = logging.getLogger(__name__)
@@ -39,10 +42,15 @@ logger = logging.getLogger(__name__)
 # المجلد الحالي
 current_dir = Path(__file__).parent.parent.absolute()
 
-# الحصول على بيانات Twilio من متغيرات البيئة
-TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
+# إعدادات محرك التذكيرات المجدول
+REMINDER_CHECK_INTERVAL = int(os.environ.get("REMINDER_CHECK_INTERVAL", 60))
+REMINDER_BATCH_SIZE = int(os.environ.get("REMINDER_BATCH_SIZE", 50))
+REMINDER_CONCURRENCY = int(os.environ.get("REMINDER_CONCURRENCY", 20))
+OUTBOX_DRAIN_INTERVAL = int(os.environ.get("OUTBOX_DRAIN_INTERVAL", 15))
+
+# مهلة إرسال رسالة واحدة عبر Twilio بالثواني. يجب أن تنتهي المحاولة قبل انتهاء حجز
+# الرسالة بوقت كافٍ، وإلا تُحجز الرسالة مرة أخرى وتُرسل مرتين
+OUTBOX_SEND_TIMEOUT = min(int(os.environ.get("OUTBOX_SEND_TIMEOUT", 60)), OUTBOX_LEASE_SECONDS // 3)
 
 def can_send_twilio_messages() -> bool:
     """
@@ -51,7 +59,7 @@ def can_send_twilio_messages() -> bool:
     العائد:
         True إذا كان يمكن إرسال رسائل Twilio، False خلاف ذلك
     """
-    return TWILIO_AVAILABLE and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER
+    return is_twilio_configured()
 
 async def confirm_delivery_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """معالجة أمر تأكيد التسليم /confirm"""
@@ -119,13 +127,10 @@ async def send_reminder_command(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return
     
-    # إرسال التذكير
-    success = await send_reminder(context, notification)
+    # إرسال التذكير (يُعلَّم الإشعار بإرسال التذكير مع جدولة رسائله)
+    success = await send_reminder(context, notification, key_suffix=f":{update.update_id}")
     
     if success:
-        # تعليم الإشعار بأنه تم إرسال تذكير له
-        mark_reminder_sent(notification_id)
-        
         await update.message.reply_text(
             f"تم إرسال تذكير للعميل {notification['customer_name']} بنجاح."
         )
@@ -163,7 +168,7 @@ async def verify_delivery_command(update: Update, context: ContextTypes.DEFAULT_
         return
     
     # إرسال رسالة التحقق
-    success = await send_verification(context, notification)
+    success = await send_verification(context, notification, key_suffix=f":{update.update_id}")
     
     if success:
         await update.message.reply_text(
@@ -174,150 +179,261 @@ async def verify_delivery_command(update: Update, context: ContextTypes.DEFAULT_
             "حدث خطأ أثناء إرسال رسالة التحقق. الرجاء التأكد من تكوين Twilio بشكل صحيح."
         )
 
+def _reminder_messages(notification: Dict[str, Any], key_suffix: str = "") -> List[Dict[str, Any]]:
+    """
+    تجهيز رسائل التذكير الصادرة للعميل (نص الرسالة وصورة الإشعار)
+    
+    المعلمات:
+        notification: بيانات الإشعار
+        key_suffix: لاحقة لمفتاح عدم التكرار، لتمييز الإرسال اليدوي عن المجدول
+        
+    العائد:
+        قائمة الرسائل، أو قائمة فارغة إذا لم يكن Twilio مضبوطاً
+    """
+    if not can_send_twilio_messages():
+        return []
+    
+    # الحصول على قالب الرسالة
+    templates = get_templates()
+    template = templates.get("sms_template", "")
+    
+    # استبدال المتغيرات في القالب
+    message = template.replace("{customer_name}", notification["customer_name"])
+    message = message.replace("{notification_id}", notification["id"][:8])
+    message = message.replace("{phone_number}", notification["phone_number"])
+    
+    messages = [{
+        "idempotency_key": f"{notification['id']}:reminder{key_suffix}",
+        "notification_id": notification["id"],
+        "message_type": "reminder",
+        "recipient": notification["phone_number"],
+        "body": message,
+    }]
+    
+    # إرفاق الصورة إذا كانت موجودة ويمكن تقديمها برابط عام؛ يُخزن مسارها المحلي
+    # ويُحوَّل إلى رابط موقع قصير الصلاحية عند كل محاولة إرسال
+    image_path = f"{current_dir}/{notification['image_path']}"
+    if os.path.exists(image_path) and is_media_url_available():
+        messages.append({
+            "idempotency_key": f"{notification['id']}:reminder_media{key_suffix}",
+            "notification_id": notification["id"],
+            "message_type": "reminder_media",
+            "recipient": notification["phone_number"],
+            "body": f"صورة الإشعار لـ {notification['customer_name']}",
+            "media_url": [notification["image_path"]],
+        })
+    
+    return messages
+
+def _schedule_outbox_drain(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """تشغيل تفريغ صندوق الرسائل فوراً بدلاً من انتظار الدورة التالية"""
+    if context.job_queue is not None:
+        context.job_queue.run_once(drain_outbox, 0, name="drain_outbox_now")
+
 async def check_for_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """فحص الإشعارات التي تحتاج إلى إرسال تذكير"""
-    # الحصول على قائمة الإشعارات التي تحتاج إلى تذكير
-    pending_reminders = get_pending_reminders()
+    """
+    فحص الإشعارات التي تحتاج إلى إرسال تذكير (مهمة مجدولة في JobQueue)
+    
+    تُسحب التذكيرات المستحقة على دفعات، وتُضاف رسائل كل دفعة إلى صندوق الرسائل
+    الصادرة مع تعليم تذكيراتها في معاملة واحدة، ثم يتولى drain_outbox الإرسال.
+    بذلك لا يرتبط معدل معالجة التذكيرات بزمن استجابة مزود الرسائل.
+    """
+    failed_ids = set()
+    queued_count = 0
     
-    if not pending_reminders:
-        logger.info("لا توجد تذكيرات بحاجة إلى إرسال في هذا الوقت")
+    while True:
+        # التذكيرات التي فشلت جدولتها تبقى مستحقة، لذا تُستبعد حتى لا تُعاد في نفس الدورة
+        batch = [
+            notification
+            for notification in get_pending_reminders(limit=REMINDER_BATCH_SIZE + len(failed_ids))
+            if notification["id"] not in failed_ids
+        ]
+        
+        if not batch:
+            break
+        
+        batch_ids = [notification["id"] for notification in batch]
+        messages = [message for notification in batch for message in _reminder_messages(notification)]
+        
+        if not enqueue_outbox_messages(messages, reminder_ids=batch_ids):
+            failed_ids.update(batch_ids)
+            logger.error(f"حدث خطأ أثناء جدولة دفعة من {len(batch)} تذكيرات")
+            continue
+        
+        queued_count += len(batch)
+        await asyncio.gather(*(notify_admins_of_reminder(context, notification) for notification in batch))
+    
+    if queued_count:
+        _schedule_outbox_drain(context)
+    
+    if queued_count or failed_ids:
+        logger.info(f"تمت جدولة {queued_count} تذكيرات، وفشل {len(failed_ids)}")
+    else:
+        logger.debug("لا توجد تذكيرات بحاجة إلى إرسال في هذا الوقت")
+
+async def drain_outbox(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    إرسال الرسائل المستحقة في صندوق الرسائل الصادرة (مهمة مجدولة في JobQueue)
+    
+    تُحجز الرسائل على دفعات وتُرسل بالتوازي (حتى REMINDER_CONCURRENCY رسالة في
+    نفس الوقت)؛ الناجحة تُعلَّم كمرسلة، والفاشلة تُعاد جدولتها بتأخير متزايد حتى
+    تُنقل إلى حالة dead. كل إرسال محدود بـ OUTBOX_SEND_TIMEOUT وبنصف مدة حجز
+    الدفعة، ويُعد تجاوز المهلة محاولة فاشلة.
+    """
+    if not can_send_twilio_messages():
         return
     
-    logger.info(f"تم العثور على {len(pending_reminders)} تذكيرات بحاجة إلى إرسال")
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(REMINDER_CONCURRENCY)
     
-    for notification in pending_reminders:
-        # إرسال التذكير
-        success = await send_reminder(context, notification)
+    async def deliver(message: Dict[str, Any], deadline: float) -> None:
+        async with semaphore:
+            error = None
+            try:
+                media_url = None
+                if message["media_url"]:
+                    # النسخة المتوسطة تكفي للرسائل وتبقى ضمن حدود حجم الوسائط لدى Twilio
+                    media_url = [
+                        signed_media_url(rendition_path(image_path, "medium"))
+                        for image_path in message["media_url"]
+                    ]
+                    if None in media_url:
+                        raise RuntimeError("MEDIA_BASE_URL or WEBHOOK_URL is required to send media")
+                
+                # الرسائل التي انتظرت دورها طويلاً تحصل على ما تبقى من مهلة الدفعة فقط
+                timeout = max(min(OUTBOX_SEND_TIMEOUT, deadline - loop.time()), 0)
+                message_sid = await asyncio.wait_for(
+                    send_twilio_message(
+                        message["recipient"],
+                        message["body"],
+                        media_url=media_url
+                    ),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                error = f"Twilio request timed out after {timeout:.0f}s"
+            except Exception as e:
+                error = str(e)
+            
+            if error is not None:
+                status = fail_outbox_message(message["idempotency_key"], error)
+                if status == "dead":
+                    logger.error(f"تم إيقاف إرسال الرسالة {message['idempotency_key']} بعد {message['attempts']} محاولات: {error}")
+                else:
+                    logger.warning(f"فشلت محاولة إرسال الرسالة {message['idempotency_key']} ({message['attempts']}): {error}")
+                return
+            
+            complete_outbox_message(message["idempotency_key"], message_sid)
+            logger.info(f"تم إرسال رسالة {message['message_type']} عبر Twilio بنجاح: {message_sid}")
+    
+    while True:
+        messages = claim_outbox_messages(REMINDER_BATCH_SIZE)
+        if not messages:
+            break
         
-        if success:
-            # تعليم الإشعار بأنه تم إرسال تذكير له
-            mark_reminder_sent(notification["id"])
-            logger.info(f"تم إرسال تذكير للعميل {notification['customer_name']} بنجاح")
-        else:
-            logger.error(f"حدث خطأ أثناء إرسال تذكير للعميل {notification['customer_name']}")
+        # يجب أن تنتهي جميع محاولات الدفعة قبل انتهاء حجزها بوقت كافٍ
+        deadline = loop.time() + OUTBOX_LEASE_SECONDS / 2
+        await asyncio.gather(*(deliver(message, deadline) for message in messages))
 
-async def send_reminder(context: ContextTypes.DEFAULT_TYPE, notification: Dict[str, Any]) -> bool:
+async def notify_admins_of_reminder(context: ContextTypes.DEFAULT_TYPE, notification: Dict[str, Any]) -> None:
     """
-    إرسال تذكير للعميل
+    إبلاغ المسؤولين بإرسال تذكير للعميل
     
     المعلمات:
         context: سياق المعالج
         notification: بيانات الإشعار
-        
-    العائد:
-        True إذا تم إرسال التذكير بنجاح، False خلاف ذلك
     """
-    try:
-        # الحصول على قالب الرسالة
-        templates = get_templates()
-        template = templates.get("sms_template", "")
-        
-        # استبدال المتغيرات في القالب
-        message = template.replace("{customer_name}", notification["customer_name"])
-        message = message.replace("{notification_id}", notification["id"][:8])
-        message = message.replace("{phone_number}", notification["phone_number"])
-        
-        # إرسال رسالة Twilio إذا كان متاحاً
-        if can_send_twilio_messages():
+    # إرسال رسالة على التيليجرام للمسؤولين
+    admins = []  # هنا يجب الحصول على قائمة المسؤولين
+    
+    for admin_id in admins:
+        try:
+            # إرسال رسالة تذكير
+            await context.bot.send_message(
+                chat_id=admin_id,
+                text=f"تم إرسال تذكير للعميل:\n\n"
+                     f"الاسم: {notification['customer_name']}\n"
+                     f"الهاتف: {notification['phone_number']}\n"
+                     f"رمز الإشعار: {notification['id'][:8]}",
+                rate_limit_args=PRIORITY_BULK
+            )
+            
+            # إرسال صورة الإشعار
             try:
-                client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-                
-                # إرسال الرسالة النصية
-                twilio_message = client.messages.create(
-                    body=message,
-                    from_=TWILIO_PHONE_NUMBER,
-                    to=notification["phone_number"]
+                await send_notification_photo(
+                    context.bot,
+                    admin_id,
+                    notification,
+                    caption=f"صورة الإشعار لـ {notification['customer_name']}",
+                    rate_limit_args=PRIORITY_BULK
                 )
-                
-                logger.info(f"تم إرسال رسالة تذكير عبر Twilio بنجاح: {twilio_message.sid}")
-                
-                # إرسال الصورة إذا كانت موجودة
-                try:
-                    image_path = f"{current_dir}/{notification['image_path']}"
-                    if os.path.exists(image_path):
-                        media_message = client.messages.create(
-                            body=f"صورة الإشعار لـ {notification['customer_name']}",
-                            from_=TWILIO_PHONE_NUMBER,
-                            to=notification["phone_number"],
-                            media_url=[f"file://{image_path}"]
-                        )
-                        
-                        logger.info(f"تم إرسال صورة إشعار عبر Twilio بنجاح: {media_message.sid}")
-                except Exception as e:
-                    logger.error(f"حدث خطأ أثناء إرسال صورة الإشعار عبر Twilio: {e}")
             except Exception as e:
-                logger.error(f"حدث خطأ أثناء إرسال رسالة Twilio: {e}")
-                return False
+                logger.error(f"حدث خطأ أثناء إرسال صورة الإشعار للمسؤول: {e}")
+        except Exception as e:
+            logger.error(f"حدث خطأ أثناء إرسال رسالة للمسؤول: {e}")
+
+async def send_reminder(context: ContextTypes.DEFAULT_TYPE, notification: Dict[str, Any], key_suffix: str = "") -> bool:
+    """
+    إرسال تذكير للعميل
+    
+    تُضاف رسائل التذكير إلى صندوق الرسائل الصادرة ويُعلَّم الإشعار بإرسال
+    التذكير في معاملة واحدة، ثم يُشغَّل تفريغ الصندوق.
+    
+    المعلمات:
+        context: سياق المعالج
+        notification: بيانات الإشعار
+        key_suffix: لاحقة لمفتاح عدم التكرار (اختياري)
         
-        # إرسال رسالة على التيليجرام للمسؤولين
-        admins = []  # هنا يجب الحصول على قائمة المسؤولين
+    العائد:
+        True إذا تمت جدولة التذكير بنجاح، False خلاف ذلك
+    """
+    try:
+        if not enqueue_outbox_messages(_reminder_messages(notification, key_suffix), reminder_ids=[notification["id"]]):
+            return False
         
-        for admin_id in admins:
-            try:
-                # إرسال رسالة تذكير
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=f"تم إرسال تذكير للعميل:\n\n"
-                         f"الاسم: {notification['customer_name']}\n"
-                         f"الهاتف: {notification['phone_number']}\n"
-                         f"رمز الإشعار: {notification['id'][:8]}"
-                )
-                
-                # إرسال صورة الإشعار
-                try:
-                    with open(f"{current_dir}/{notification['image_path']}", "rb") as image_file:
-                        await context.bot.send_photo(
-                            chat_id=admin_id,
-                            photo=image_file,
-                            caption=f"صورة الإشعار لـ {notification['customer_name']}"
-                        )
-                except Exception as e:
-                    logger.error(f"حدث خطأ أثناء إرسال صورة الإشعار للمسؤول: {e}")
-            except Exception as e:
-                logger.error(f"حدث خطأ أثناء إرسال رسالة للمسؤول: {e}")
+        _schedule_outbox_drain(context)
+        await notify_admins_of_reminder(context, notification)
         
         return True
     except Exception as e:
         logger.error(f"حدث خطأ أثناء إرسال التذكير: {e}")
         return False
 
-async def send_verification(context: ContextTypes.DEFAULT_TYPE, notification: Dict[str, Any]) -> bool:
+async def send_verification(context: ContextTypes.DEFAULT_TYPE, notification: Dict[str, Any], key_suffix: str = "") -> bool:
     """
     إرسال رسالة تحقق من التسليم للعميل
     
     المعلمات:
         context: سياق المعالج
         notification: بيانات الإشعار
+        key_suffix: لاحقة لمفتاح عدم التكرار (اختياري)
         
     العائد:
-        True إذا تم إرسال رسالة التحقق بنجاح، False خلاف ذلك
+        True إذا تمت جدولة رسالة التحقق بنجاح، False خلاف ذلك
     """
     try:
-        # الحصول على قالب الرسالة
-        templates = get_templates()
-        template = templates.get("verification_template", "")
-        
-        # استبدال المتغيرات في القالب
-        message = template.replace("{customer_name}", notification["customer_name"])
-        message = message.replace("{notification_id}", notification["id"][:8])
-        message = message.replace("{phone_number}", notification["phone_number"])
-        
-        # إرسال رسالة Twilio إذا كان متاحاً
+        # جدولة رسالة Twilio إذا كان متاحاً
         if can_send_twilio_messages():
-            try:
-                client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-                
-                # إرسال الرسالة النصية
-                twilio_message = client.messages.create(
-                    body=message,
-                    from_=TWILIO_PHONE_NUMBER,
-                    to=notification["phone_number"]
-                )
-                
-                logger.info(f"تم إرسال رسالة تحقق عبر Twilio بنجاح: {twilio_message.sid}")
-            except Exception as e:
-                logger.error(f"حدث خطأ أثناء إرسال رسالة Twilio: {e}")
+            # الحصول على قالب الرسالة
+            templates = get_templates()
+            template = templates.get("verification_template", "")
+            
+            # استبدال المتغيرات في القالب
+            message = template.replace("{customer_name}", notification["customer_name"])
+            message = message.replace("{notification_id}", notification["id"][:8])
+            message = message.replace("{phone_number}", notification["phone_number"])
+            
+            queued = enqueue_outbox_messages([{
+                "idempotency_key": f"{notification['id']}:verification{key_suffix}",
+                "notification_id": notification["id"],
+                "message_type": "verification",
+                "recipient": notification["phone_number"],
+                "body": message,
+            }])
+            if not queued:
                 return False
+            
+            _schedule_outbox_drain(context)
         
         # إرسال رسالة على التيليجرام للمسؤولين
         admins = []  # هنا يجب الحصول على قائمة المسؤولين
@@ -329,7 +445,8 @@ async def send_verification(context: ContextTypes.DEFAULT_TYPE, notification: Di
                     text=f"تم إرسال رسالة تحقق للعميل:\n\n"
                          f"الاسم: {notification['customer_name']}\n"
                          f"الهاتف: {notification['phone_number']}\n"
-                         f"رمز الإشعار: {notification['id'][:8]}"
+                         f"رمز الإشعار: {notification['id'][:8]}",
+                    rate_limit_args=PRIORITY_BULK
                 )
             except Exception as e:
                 logger.error(f"حدث خطأ أثناء إرسال رسالة للمسؤول: {e}")
@@ -20,6 +20,7 @@ from utils.database import (
     search_notifications_by_phone,
     get_notification,
 )
+from utils.telegram_media import send_notification_photos
 
 # إعداد السجل
 logger = logging.getLogger(__name__)
@@ -75,18 +76,16 @@ async def search_notification(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     await update.message.reply_text(message)
     
-    # إرسال صور الإشعارات
-    for notification in results:
-        try:
-            with open(f"{current_dir}/{notification['image_path']}", "rb") as image_file:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=image_file,
-                    caption=f"صورة الإشعار رقم {notification['id'][:8]}"
-                )
-        except Exception as e:
-            logger.error(f"Error sending notification image: {e}")
-            await update.message.reply_text(f"حدث خطأ أثناء إرسال صورة الإشعار {notification['id'][:8]}")
+    # إرسال صور الإشعارات في ألبومات
+    try:
+        await send_notification_photos(
+            context.bot,
+            update.effective_chat.id,
+            [(notification, f"صورة الإشعار رقم {notification['id'][:8]}") for notification in results]
+        )
+    except Exception as e:
+        logger.error(f"Error sending notification images: {e}")
+        await update.message.reply_text("حدث خطأ أثناء إرسال صور الإشعارات")
 
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """إلغاء المحادثة الحالية"""
@@ -2,10 +2,12 @@
 نقطة دخول رئيسية للتوافق مع منصة Render
 """
 
-from app import app
+from aiohttp import web
+
+from app import create_app
 
 # يتم التنفيذ من هنا في بيئة Render
 if __name__ == '__main__':
     import os
     port = int(os.environ.get("PORT", 10000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    web.run_app(create_app(), host='0.0.0.0', port=port)
\ No newline at end of file
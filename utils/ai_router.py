@@ -0,0 +1,235 @@
+"""
+موجه طلبات الذكاء الاصطناعي - يوزع الطلبات بين المزودين مع التحوط وقياس زمن الاستجابة وقاطع الدائرة
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+# وضع التوجيه: fallback (بالترتيب عند الفشل فقط)، hedge (تشغيل المزود التالي إذا تأخر
+# الأول عن p95 الخاص به)، race (تشغيل جميع المزودين معاً)
+AI_ROUTING_MODE = os.environ.get("AI_ROUTING_MODE", "hedge")
+AI_PROVIDER_ORDER = [
+    provider.strip()
+    for provider in os.environ.get("AI_PROVIDER_ORDER", "openai,anthropic").split(",")
+    if provider.strip()
+]
+
+# قاطع الدائرة: عدد الإخفاقات المتتالية قبل تخطي المزود، ومدة التخطي بالثواني
+AI_BREAKER_THRESHOLD = int(os.environ.get("AI_BREAKER_THRESHOLD", 3))
+AI_BREAKER_COOLDOWN = float(os.environ.get("AI_BREAKER_COOLDOWN", 60))
+
+# عدد قياسات زمن الاستجابة المحفوظة لكل مزود، والحد الأدنى منها لحساب p95
+LATENCY_WINDOW = 100
+MIN_LATENCY_SAMPLES = 5
+
+class _ProviderState:
+    """قياسات زمن الاستجابة وحالة قاطع الدائرة لمزود واحد"""
+    
+    __slots__ = ("latencies", "calls", "failures", "consecutive_failures", "open_until")
+    
+    def __init__(self) -> None:
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+    
+    def percentile(self, fraction: float) -> Optional[float]:
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+    
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+class AIRouter:
+    """
+    موجه طلبات بين مزودي الذكاء الاصطناعي
+    
+    يستقبل لكل طلب دالة لكل مزود تعيد النتيجة أو None عند الفشل، ويعيد أول
+    نتيجة ناجحة. في وضع hedge يُشغَّل المزود التالي إذا لم يرد الحالي خلال
+    p95 زمن استجابته (أو hedge_delay قبل توفر قياسات كافية)، وعند فشل أي مزود
+    يُشغَّل التالي فوراً. المزود الذي يفشل AI_BREAKER_THRESHOLD مرات متتالية
+    يُتخطى لمدة AI_BREAKER_COOLDOWN ثانية.
+    """
+    
+    def __init__(self, name: str, hedge_delay: float, mode: str = AI_ROUTING_MODE,
+                 order: Optional[List[str]] = None) -> None:
+        self.name = name
+        self.hedge_delay = hedge_delay
+        self.mode = mode
+        self.order = order or AI_PROVIDER_ORDER
+        self._providers: Dict[str, _ProviderState] = {}
+    
+    def _state(self, provider: str) -> _ProviderState:
+        return self._providers.setdefault(provider, _ProviderState())
+    
+    def _candidates(self, calls: Dict[str, Any]) -> List[str]:
+        """المزودون المتاحون بالترتيب المضبوط، باستثناء من دائرته مفتوحة"""
+        now = time.monotonic()
+        providers = [provider for provider in self.order if provider in calls]
+        providers += [provider for provider in calls if provider not in providers]
+        
+        closed = [provider for provider in providers if not self._state(provider).is_open(now)]
+        # إذا كانت جميع الدوائر مفتوحة، تُجرب جميعها بدلاً من رفض الطلب
+        return closed or providers
+    
+    def _hedge_timeout(self, provider: str) -> float:
+        p95 = self._state(provider).percentile(0.95)
+        return p95 if p95 is not None else self.hedge_delay
+    
+    def _record(self, provider: str, success: bool, started: float) -> None:
+        """تسجيل نتيجة طلب في قياسات المزود وقاطع الدائرة"""
+        state = self._state(provider)
+        now = time.monotonic()
+        state.calls += 1
+        if success:
+            state.latencies.append(now - started)
+            state.consecutive_failures = 0
+        else:
+            state.failures += 1
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= AI_BREAKER_THRESHOLD:
+                state.open_until = now + AI_BREAKER_COOLDOWN
+                logger.warning(f"{self.name}: circuit open for {provider} for {AI_BREAKER_COOLDOWN}s")
+    
+    async def _timed(self, provider: str, call: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        started = time.monotonic()
+        
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"{self.name}: provider {provider} failed: {e}")
+            result = None
+        
+        self._record(provider, bool(result), started)
+        return result
+    
+    async def run(self, calls: Dict[str, Callable[[], Awaitable[Optional[str]]]]) -> Optional[str]:
+        """
+        تنفيذ الطلب عبر المزودين
+        
+        المعلمات:
+            calls: قاموس اسم المزود ← دالة بدون معلمات تعيد النتيجة أو None
+        
+        العائد:
+            أول نتيجة ناجحة، أو None إذا فشل جميع المزودين
+        """
+        candidates = self._candidates(calls)
+        if not candidates:
+            return None
+        
+        pending: Dict[asyncio.Task, str] = {}
+        launched = 0
+        last_launch = 0.0
+        
+        def launch() -> None:
+            nonlocal launched, last_launch
+            provider = candidates[launched]
+            launched += 1
+            last_launch = time.monotonic()
+            pending[asyncio.create_task(self._timed(provider, calls[provider]))] = provider
+        
+        launch()
+        if self.mode == "race":
+            while launched < len(candidates):
+                launch()
+        
+        try:
+            while pending:
+                timeout = None
+                if self.mode == "hedge" and launched < len(candidates):
+                    hedge_at = last_launch + self._hedge_timeout(candidates[launched - 1])
+                    timeout = max(hedge_at - time.monotonic(), 0)
+                
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    logger.info(f"{self.name}: {candidates[launched - 1]} is slow, hedging with {candidates[launched]}")
+                    launch()
+                    continue
+                
+                for task in done:
+                    del pending[task]
+                    result = task.result()
+                    if result:
+                        return result
+                
+                # فشل مزود، تشغيل التالي فوراً
+                if launched < len(candidates):
+                    launch()
+            
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def stream(self, calls: Dict[str, Callable[[], AsyncIterator[str]]]) -> AsyncIterator[str]:
+        """
+        بث الرد من أول مزود متاح
+        
+        لا يُستخدم التحوط هنا لأن النص يُعرض للمستخدم أثناء وصوله؛ إذا فشل المزود
+        قبل إرسال أي نص يُنتقل إلى التالي، أما إذا فشل بعد ذلك فيتوقف البث.
+        يجب إغلاق المولد (aclose) عند التوقف قبل نهايته حتى يُغلق بث المزود.
+        
+        المعلمات:
+            calls: قاموس اسم المزود ← دالة بدون معلمات تعيد مولداً غير متزامن لأجزاء النص
+        
+        العائد:
+            أجزاء النص بترتيب وصولها
+        """
+        for provider in self._candidates(calls):
+            started = time.monotonic()
+            emitted = False
+            chunks = calls[provider]()
+            
+            try:
+                async for chunk in chunks:
+                    if chunk:
+                        emitted = True
+                        yield chunk
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.name}: provider {provider} stream failed: {e}")
+                self._record(provider, False, started)
+                if emitted:
+                    return
+                continue
+            finally:
+                # إغلاق بث المزود فوراً، بما في ذلك عند إغلاق هذا المولد مبكراً
+                await chunks.aclose()
+            
+            self._record(provider, emitted, started)
+            if emitted:
+                return
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        إحصائيات المزودين
+        
+        العائد:
+            قاموس حسب المزود يحتوي على عدد الطلبات والإخفاقات وp50 وp95 بالثواني
+            وحالة قاطع الدائرة
+        """
+        now = time.monotonic()
+        return {
+            provider: {
+                "calls": state.calls,
+                "failures": state.failures,
+                "p50": state.percentile(0.5),
+                "p95": state.percentile(0.95),
+                "circuit_open": state.is_open(now),
+            }
+            for provider, state in self._providers.items()
+        }
@@ -0,0 +1,131 @@
+"""
+ذاكرة المحادثة الذكية - مخزن محدود الحجم لرسائل كل محادثة مع ميزانية رموز وتلخيص اختياري وانتهاء صلاحية عند الخمول
+"""
+
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# الحد الأقصى لعدد الرسائل المحفوظة لكل محادثة (المخزن دائري: تُحذف الأقدم عند الامتلاء)
+AI_MEMORY_MAX_TURNS = int(os.environ.get("AI_MEMORY_MAX_TURNS", 10))
+
+# ميزانية الرموز التقديرية لسجل المحادثة المرسل مع كل طلب
+AI_MEMORY_TOKEN_BUDGET = int(os.environ.get("AI_MEMORY_TOKEN_BUDGET", 1500))
+
+# تلخيص الرسائل المحذوفة من المخزن بدلاً من نسيانها
+AI_MEMORY_SUMMARIZE = os.environ.get("AI_MEMORY_SUMMARIZE", "false").lower() in ("1", "true", "yes")
+
+# مدة الخمول بالثواني التي تُنسى بعدها المحادثة
+AI_MEMORY_IDLE_TIMEOUT = int(os.environ.get("AI_MEMORY_IDLE_TIMEOUT", 1800))
+
+# الحد الأقصى لطول الملخص بالأحرف
+MAX_SUMMARY_LENGTH = 1000
+
+def estimate_tokens(text: str) -> int:
+    """
+    تقدير عدد رموز النص دون تحميل مُرمِّز (النص العربي أكثف من الإنجليزي
+    لذا يُحسب رمز لكل 3 أحرف تقريباً)
+    
+    المعلمات:
+        text: النص
+    
+    العائد:
+        العدد التقديري للرموز
+    """
+    return len(text) // 3 + 4
+
+class ConversationMemory:
+    """
+    سجل محادثة محدود الحجم لمستخدم واحد
+    
+    تُحفظ آخر AI_MEMORY_MAX_TURNS رسالة في مخزن دائري، ويُرسل منها إلى
+    النموذج أحدث ما يتسع ضمن ميزانية الرموز. إذا كان التلخيص مفعلاً تُجمع
+    الرسائل المحذوفة من المخزن حتى تُدمج في ملخص واحد عبر set_summary.
+    """
+    
+    __slots__ = ("turns", "evicted", "summary", "last_active", "summarizing")
+    
+    def __init__(self) -> None:
+        self.turns: Deque[Dict[str, str]] = deque(maxlen=AI_MEMORY_MAX_TURNS)
+        self.evicted: Deque[Dict[str, str]] = deque(maxlen=AI_MEMORY_MAX_TURNS)
+        self.summary: Optional[str] = None
+        self.last_active = time.time()
+        # يوجد تلخيص قيد التنفيذ في الخلفية
+        self.summarizing = False
+    
+    def add(self, role: str, content: str) -> None:
+        """
+        إضافة رسالة إلى السجل
+        
+        المعلمات:
+            role: دور المرسل (user أو assistant)
+            content: نص الرسالة
+        """
+        if len(self.turns) == self.turns.maxlen and AI_MEMORY_SUMMARIZE:
+            self.evicted.append(self.turns[0])
+        
+        self.turns.append({"role": role, "content": content})
+        self.last_active = time.time()
+    
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        """التحقق مما إذا تجاوزت المحادثة مدة الخمول"""
+        return (now or time.time()) - self.last_active > AI_MEMORY_IDLE_TIMEOUT
+    
+    def prompt(self, budget: int = AI_MEMORY_TOKEN_BUDGET) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        بناء سجل المحادثة المرسل إلى النموذج
+        
+        تُؤخذ أحدث الرسائل ما دامت ضمن الميزانية (أحدث رسالة تُرسل دائماً)،
+        ويبدأ السجل برسالة من المستخدم كما تتطلب واجهات النماذج.
+        
+        المعلمات:
+            budget: ميزانية الرموز التقديرية
+        
+        العائد:
+            زوج (الرسائل من الأقدم إلى الأحدث، ملخص الرسائل السابقة أو None)
+        """
+        if self.summary:
+            budget -= estimate_tokens(self.summary)
+        
+        selected: List[Dict[str, str]] = []
+        for turn in reversed(self.turns):
+            cost = estimate_tokens(turn["content"])
+            if selected and cost > budget:
+                break
+            selected.append(turn)
+            budget -= cost
+        
+        selected.reverse()
+        while len(selected) > 1 and selected[0]["role"] != "user":
+            selected.pop(0)
+        
+        return selected, self.summary
+    
+    def needs_summary(self) -> bool:
+        """التحقق مما إذا كانت هناك رسائل محذوفة لم تُلخص بعد ولا يوجد تلخيص قيد التنفيذ"""
+        return bool(self.evicted) and not self.summarizing
+    
+    def take_evicted(self) -> List[Dict[str, str]]:
+        """
+        سحب الرسائل المحذوفة التي تنتظر التلخيص
+        
+        العائد:
+            الرسائل من الأقدم إلى الأحدث
+        """
+        turns = list(self.evicted)
+        self.evicted.clear()
+        return turns
+    
+    def restore_evicted(self, turns: List[Dict[str, str]]) -> None:
+        """
+        إعادة رسائل سُحبت للتلخيص ولم تُلخص (فشل طلب التلخيص) إلى أول قائمة الانتظار
+        
+        المعلمات:
+            turns: الرسائل من الأقدم إلى الأحدث
+        """
+        self.evicted = deque(turns + list(self.evicted), maxlen=self.evicted.maxlen)
+    
+    def set_summary(self, summary: str) -> None:
+        """تعيين ملخص الرسائل السابقة"""
+        self.summary = summary.strip()[:MAX_SUMMARY_LENGTH] or None
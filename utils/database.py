@@ -5,10 +5,19 @@
 import json
 import logging
 import os
+import re
+import sqlite3
+import threading
+import time
 import uuid
+from bisect import bisect_left, insort
+from heapq import heappop, heappush, nsmallest
+from operator import itemgetter
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Set, Tuple, Union
+
+from utils.phones import normalize_phone, normalize_many, only_digits, phone_digits
 
 # إعداد السجل
 logger = logging.getLogger(__name__)
@@ -20,11 +29,769 @@ IMAGES_DIR = DATA_DIR / "images"
 ADMINS_FILE = DATA_DIR / "admins.json"
 NOTIFICATIONS_FILE = DATA_DIR / "notifications.json"
 TEMPLATES_FILE = DATA_DIR / "templates.json"
+DATABASE_FILE = DATA_DIR / "notifications.db"
+WAL_FILE = DATA_DIR / "notifications.db-wal"
+
+# عتبات ضغط سجل WAL في الخلفية: الحجم بالبايت والمدة بالثواني
+WAL_CHECKPOINT_BYTES = int(os.environ.get("WAL_CHECKPOINT_BYTES", 4 * 1024 * 1024))
+WAL_CHECKPOINT_INTERVAL = int(os.environ.get("WAL_CHECKPOINT_INTERVAL", 300))
+
+# إعدادات صندوق الرسائل الصادرة: عدد المحاولات قبل نقل الرسالة إلى حالة dead،
+# وتأخير إعادة المحاولة الأساسي والأقصى بالثواني، ومدة حجز الرسالة أثناء الإرسال
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_RETRY_BASE_DELAY = int(os.environ.get("OUTBOX_RETRY_BASE_DELAY", 30))
+OUTBOX_RETRY_MAX_DELAY = int(os.environ.get("OUTBOX_RETRY_MAX_DELAY", 3600))
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", 300))
+
+# ذاكرة تحليلات الصور المؤقتة: مدة صلاحية النتيجة بالثواني والحد الأقصى لعدد النتائج المحفوظة
+AI_IMAGE_CACHE_TTL = int(os.environ.get("AI_IMAGE_CACHE_TTL", 30 * 24 * 3600))
+AI_IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get("AI_IMAGE_CACHE_MAX_ENTRIES", 1000))
 
 # التأكد من وجود المجلدات اللازمة
 DATA_DIR.mkdir(exist_ok=True)
 IMAGES_DIR.mkdir(exist_ok=True)
 
+# اتصال SQLite مشترك على مستوى العملية مع قفل لحماية الوصول من عدة خيوط
+_connection: Optional[sqlite3.Connection] = None
+_db_lock = threading.RLock()
+
+# ذاكرة مؤقتة للإشعارات على مستوى العملية: قاموس معرف ← سجل بترتيب الإدراج،
+# وقائمة مبنية منه عند الطلب، ورقم إصدار قاعدة البيانات الذي حُمّلت عنده،
+# وفهارس البحث (لواحق أرقام الهواتف وثلاثيات الأسماء) وطابور التذكيرات المبنية من نفس السجلات
+_notifications_by_id: Optional[Dict[str, Dict[str, Any]]] = None
+_notifications_list: Optional[List[Dict[str, Any]]] = None
+_cache_data_version: Optional[int] = None
+_phone_index: Optional["_PhoneSuffixIndex"] = None
+_name_index: Optional["_NameTrigramIndex"] = None
+_reminder_queue: Optional["_ReminderQueue"] = None
+
+# خيط ضغط سجل WAL في الخلفية
+_compactor_thread: Optional[threading.Thread] = None
+
+# مخطط جدول الإشعارات: السجل الكامل يُخزَّن كـ JSON في عمود data،
+# والأعمدة الأخرى نسخ من الحقول المستخدمة في الفهارس
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    phone_number TEXT,
+    reminder_time TEXT,
+    reminder_sent INTEGER NOT NULL DEFAULT 0,
+    delivery_confirmed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_reminder_time ON notifications (reminder_time);
+CREATE INDEX IF NOT EXISTS idx_notifications_phone_number ON notifications (phone_number);
+CREATE INDEX IF NOT EXISTS idx_notifications_delivery_confirmed ON notifications (delivery_confirmed);
+CREATE INDEX IF NOT EXISTS idx_notifications_pending_reminders ON notifications (reminder_time) WHERE reminder_sent = 0;
+
+CREATE TABLE IF NOT EXISTS outbox (
+    idempotency_key TEXT PRIMARY KEY,
+    notification_id TEXT NOT NULL,
+    message_type TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    body TEXT NOT NULL,
+    media_url TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL,
+    last_error TEXT,
+    provider_sid TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at) WHERE status IN ('pending', 'sending');
+
+CREATE TABLE IF NOT EXISTS ai_image_cache (
+    image_hash TEXT PRIMARY KEY,
+    analysis TEXT NOT NULL,
+    extracted_data TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    last_used_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ai_image_cache_last_used ON ai_image_cache (last_used_at);
+"""
+
+class _PhoneSuffixIndex:
+    """
+    فهرس أرقام الهواتف الموحدة ولواحقها
+    
+    المفاتيح هي الأرقام الموحدة (انظر utils.phones)، فالبحث برقم كامل مطابقة
+    تامة في قاموس. للبحث بجزء من الرقم يحتفظ بقائمة مرتبة من الأرقام المعكوسة،
+    فيصبح البحث عن الأرقام التي تنتهي بالاستعلام بحثاً ثنائياً عن بادئة، ويُبحث
+    عن الأرقام المخزنة التي ينتهي بها الاستعلام في قاموس الأرقام الكاملة. تكلفة
+    البحث تتناسب مع طول الاستعلام وعدد النتائج وليس مع عدد الإشعارات.
+    """
+    
+    def __init__(self, notifications: Optional[List[Dict[str, Any]]] = None) -> None:
+        self._entries: List[Tuple[str, str]] = []
+        self._digits_by_id: Dict[str, str] = {}
+        self._ids_by_digits: Dict[str, Set[str]] = {}
+        self._order: Dict[str, int] = {}
+        self._next_order = 0
+        
+        for notification in notifications or []:
+            digits = phone_digits(notification.get("phone_number"))
+            self._order[notification["id"]] = self._next_order
+            self._next_order += 1
+            self._digits_by_id[notification["id"]] = digits
+            self._ids_by_digits.setdefault(digits, set()).add(notification["id"])
+            self._entries.append((digits[::-1], notification["id"]))
+        
+        self._entries.sort()
+    
+    def put(self, notification_id: str, phone_number: Optional[str]) -> None:
+        """إضافة إشعار إلى الفهرس أو تحديث رقم هاتفه"""
+        digits = phone_digits(phone_number)
+        previous = self._digits_by_id.get(notification_id)
+        
+        if previous == digits:
+            return
+        
+        if previous is None:
+            self._order[notification_id] = self._next_order
+            self._next_order += 1
+        else:
+            self._discard(notification_id, previous)
+        
+        self._digits_by_id[notification_id] = digits
+        self._ids_by_digits.setdefault(digits, set()).add(notification_id)
+        insort(self._entries, (digits[::-1], notification_id))
+    
+    def remove(self, notification_id: str) -> None:
+        """إزالة إشعار من الفهرس"""
+        digits = self._digits_by_id.pop(notification_id, None)
+        if digits is not None:
+            self._discard(notification_id, digits)
+            del self._order[notification_id]
+    
+    def _discard(self, notification_id: str, digits: str) -> None:
+        entry = (digits[::-1], notification_id)
+        position = bisect_left(self._entries, entry)
+        if position < len(self._entries) and self._entries[position] == entry:
+            del self._entries[position]
+        
+        ids = self._ids_by_digits.get(digits)
+        if ids is not None:
+            ids.discard(notification_id)
+            if not ids:
+                del self._ids_by_digits[digits]
+    
+    def exact(self, digits: str) -> List[str]:
+        """
+        البحث عن الإشعارات التي رقمها الموحد يساوي الاستعلام
+        
+        العائد:
+            معرفات الإشعارات المطابقة بترتيب الإدراج
+        """
+        return sorted(self._ids_by_digits.get(digits, ()), key=self._order.__getitem__)
+    
+    def search(self, digits: str) -> List[str]:
+        """
+        البحث عن الإشعارات التي ينتهي رقمها بالاستعلام أو ينتهي الاستعلام برقمها
+        
+        العائد:
+            معرفات الإشعارات المطابقة بترتيب الإدراج
+        """
+        reversed_digits = digits[::-1]
+        matches: Set[str] = set()
+        
+        # الأرقام المخزنة التي تنتهي بالاستعلام
+        start = bisect_left(self._entries, (reversed_digits,))
+        end = bisect_left(self._entries, (reversed_digits + "\U0010ffff",))
+        matches.update(notification_id for _, notification_id in self._entries[start:end])
+        
+        # الأرقام المخزنة التي ينتهي بها الاستعلام
+        for offset in range(len(digits) + 1):
+            matches.update(self._ids_by_digits.get(digits[offset:], ()))
+        
+        return sorted(matches, key=self._order.__getitem__)
+
+# جدول توحيد الأحرف العربية: صور الألف والهمزة والتاء المربوطة والألف المقصورة
+_ARABIC_NORMALIZATION = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ؤ": "و",
+    "ئ": "ي",
+    "ى": "ي",
+    "ة": "ه",
+})
+
+# التشكيل والتطويل
+_ARABIC_DIACRITICS = re.compile(r"[\u064B-\u065F\u0670\u0640]")
+_WHITESPACE = re.compile(r"\s+")
+
+def _normalize_name(name: Optional[str]) -> str:
+    """
+    توحيد اسم العميل للبحث: إزالة التشكيل والتطويل وتوحيد صور الألف والهمزة
+    والتاء المربوطة والألف المقصورة وتحويل الأحرف اللاتينية إلى صغيرة
+    
+    المعلمات:
+        name: الاسم
+        
+    العائد:
+        الاسم الموحد
+    """
+    name = _ARABIC_DIACRITICS.sub("", (name or "").lower())
+    return _WHITESPACE.sub(" ", name.translate(_ARABIC_NORMALIZATION)).strip()
+
+def _trigrams(text: str) -> Set[str]:
+    """استخراج مجموعة الثلاثيات الحرفية من نص"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _edit_distance(first: str, second: str, max_distance: int) -> int:
+    """
+    مسافة التحرير (Levenshtein) بين كلمتين مع التوقف المبكر
+    
+    العائد:
+        المسافة، أو max_distance + 1 إذا تجاوزت max_distance
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i]
+        for j, other in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    
+    return min(previous[-1], max_distance + 1)
+
+class _NameTrigramIndex:
+    """
+    فهرس مقلوب للثلاثيات الحرفية في أسماء العملاء بعد توحيدها
+    
+    يُستخرج المرشحون بتقاطع قوائم الثلاثيات بدءاً بأقصرها ثم يُتحقق من احتواء
+    الاسم على الاستعلام. إذا لم توجد مطابقة، تُطابق كل كلمة في الاستعلام مع
+    كلمات الأسماء القريبة منها إملائياً (مسافة التحرير) عبر فهرس ثلاثيات
+    مستقل لكلمات الأسماء المختلفة، وهي أقل بكثير من عدد الإشعارات.
+    """
+    
+    # الكلمات التي يبلغ طولها هذا الحد تقبل خطأين إملائيين في البحث التقريبي، والأقصر خطأً واحداً
+    FUZZY_LONG_WORD = 7
+    
+    def __init__(self, notifications: Optional[List[Dict[str, Any]]] = None) -> None:
+        self._postings: Dict[str, Set[str]] = {}
+        self._names: Dict[str, str] = {}
+        self._order: Dict[str, int] = {}
+        self._next_order = 0
+        # كلمات الأسماء وإشعاراتها، وثلاثيات كل كلمة للبحث التقريبي
+        self._words: Dict[str, Set[str]] = {}
+        self._word_postings: Dict[str, Set[str]] = {}
+        # الأسماء مرتبة أبجدياً (الاسم، ترتيب الإدراج، المعرف) لاستخراج أسماء البادئة بالبحث الثنائي
+        self._sorted_names: List[Tuple[str, int, str]] = []
+        
+        for notification in notifications or []:
+            name = _normalize_name(notification.get("customer_name"))
+            self._order[notification["id"]] = self._next_order
+            self._next_order += 1
+            self._add(notification["id"], name)
+            self._sorted_names.append((name, self._order[notification["id"]], notification["id"]))
+        
+        self._sorted_names.sort()
+    
+    def put(self, notification_id: str, customer_name: Optional[str]) -> None:
+        """إضافة إشعار إلى الفهرس أو تحديث اسم العميل فيه"""
+        name = _normalize_name(customer_name)
+        previous = self._names.get(notification_id)
+        
+        if previous == name:
+            return
+        
+        if previous is None:
+            self._order[notification_id] = self._next_order
+            self._next_order += 1
+        else:
+            self._discard(notification_id, previous)
+        
+        self._add(notification_id, name)
+        insort(self._sorted_names, (name, self._order[notification_id], notification_id))
+    
+    def _add(self, notification_id: str, name: str) -> None:
+        self._names[notification_id] = name
+        for trigram in _trigrams(f" {name} "):
+            self._postings.setdefault(trigram, set()).add(notification_id)
+        
+        for word in set(name.split()):
+            ids = self._words.get(word)
+            if ids is None:
+                ids = self._words[word] = set()
+                for trigram in _trigrams(f" {word} "):
+                    self._word_postings.setdefault(trigram, set()).add(word)
+            ids.add(notification_id)
+    
+    def remove(self, notification_id: str) -> None:
+        """إزالة إشعار من الفهرس"""
+        name = self._names.pop(notification_id, None)
+        if name is not None:
+            self._discard(notification_id, name)
+            del self._order[notification_id]
+    
+    def _discard(self, notification_id: str, name: str) -> None:
+        entry = (name, self._order[notification_id], notification_id)
+        position = bisect_left(self._sorted_names, entry)
+        if position < len(self._sorted_names) and self._sorted_names[position] == entry:
+            del self._sorted_names[position]
+        
+        for trigram in _trigrams(f" {name} "):
+            ids = self._postings.get(trigram)
+            if ids is not None:
+                ids.discard(notification_id)
+                if not ids:
+                    del self._postings[trigram]
+        
+        for word in set(name.split()):
+            ids = self._words.get(word)
+            if ids is None:
+                continue
+            ids.discard(notification_id)
+            if ids:
+                continue
+            
+            del self._words[word]
+            for trigram in _trigrams(f" {word} "):
+                words = self._word_postings.get(trigram)
+                if words is not None:
+                    words.discard(word)
+                    if not words:
+                        del self._word_postings[trigram]
+    
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """
+        البحث عن الإشعارات التي يحتوي اسم عميلها على الاستعلام
+        
+        تُرتب النتائج: المطابقة التامة، ثم بداية الاسم، ثم بداية كلمة، ثم أي
+        موضع، ويُحافظ على ترتيب الإدراج داخل كل فئة. مع limit تُختار أفضل
+        النتائج عبر heap دون ترتيب جميع المطابقات، وإذا كانت الأسماء التي تبدأ
+        بالاستعلام تكفي تُؤخذ من القائمة المرتبة دون فحص بقية المرشحين.
+        
+        العائد:
+            معرفات الإشعارات المطابقة
+        """
+        query = _normalize_name(query)
+        query_trigrams = _trigrams(query)
+        names = self._names
+        
+        if limit and query:
+            prefixed = self._search_prefix(query, limit)
+            if prefixed is not None:
+                return prefixed
+        
+        if query_trigrams:
+            postings = sorted((self._postings.get(t, set()) for t in query_trigrams), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        elif query:
+            # استعلام أقصر من ثلاثة أحرف: اتحاد قوائم الثلاثيات التي تحتويه
+            # (الأسماء مفهرسة محاطة بمسافتين، فكل حرف أو حرفين منها داخل ثلاثية)
+            candidates = set().union(*(ids for trigram, ids in self._postings.items() if query in trigram))
+        else:
+            candidates = names.keys()
+        
+        order = self._order
+        word_query = f" {query}"
+        
+        # التحقق من المطابقة وتحديد فئة الترتيب في مرور واحد
+        ranked: List[Tuple[int, int, str]] = []
+        for notification_id in candidates:
+            name = names[notification_id]
+            position = name.find(query)
+            if position < 0:
+                continue
+            
+            if position == 0:
+                category = 0 if len(name) == len(query) else 1
+            elif name[position - 1] == " " or word_query in name:
+                category = 2
+            else:
+                category = 3
+            ranked.append((category, order[notification_id], notification_id))
+        
+        if not ranked and query_trigrams:
+            return self._search_similar(query, limit)
+        
+        ranked = nsmallest(limit, ranked) if limit else sorted(ranked)
+        return [notification_id for _, _, notification_id in ranked]
+    
+    def _search_prefix(self, query: str, limit: int) -> Optional[List[str]]:
+        """
+        أفضل limit نتيجة من الأسماء المطابقة تماماً ثم التي تبدأ بالاستعلام
+        
+        العائد:
+            المعرفات، أو None إذا كانت هذه الأسماء أقل من limit
+        """
+        start = bisect_left(self._sorted_names, (query,))
+        end = bisect_left(self._sorted_names, (query + "\U0010ffff",), start)
+        if end - start < limit:
+            return None
+        
+        # الأسماء المطابقة تماماً في أول النطاق، مرتبة حسب الإدراج
+        exact_end = bisect_left(self._sorted_names, (query, self._next_order), start, end)
+        results = [notification_id for _, _, notification_id in self._sorted_names[start:min(exact_end, start + limit)]]
+        
+        if len(results) < limit:
+            prefixed = nsmallest(limit - len(results), self._sorted_names[exact_end:end], key=itemgetter(1))
+            results.extend(notification_id for _, _, notification_id in prefixed)
+        
+        return results
+    
+    def _similar_words(self, word: str) -> Dict[str, int]:
+        """
+        كلمات الأسماء القريبة إملائياً من كلمة الاستعلام
+        
+        العائد:
+            قاموس الكلمة المفهرسة ومسافة التحرير بينها وبين كلمة الاستعلام
+        """
+        max_distance = 2 if len(word) >= self.FUZZY_LONG_WORD else 1
+        word_trigrams = _trigrams(f" {word} ")
+        # كل خطأ إملائي يُفسد ثلاث ثلاثيات على الأكثر
+        min_shared = max(1, len(word_trigrams) - 3 * max_distance)
+        
+        shared: Dict[str, int] = {}
+        for trigram in word_trigrams:
+            for candidate in self._word_postings.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        
+        similar: Dict[str, int] = {}
+        for candidate, count in shared.items():
+            if count >= min_shared:
+                distance = _edit_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    similar[candidate] = distance
+        
+        return similar
+    
+    def _search_similar(self, query: str, limit: Optional[int]) -> List[str]:
+        """
+        البحث التقريبي: الأسماء التي تحتوي على كلمة قريبة من كل كلمة في الاستعلام
+        
+        تُرتب النتائج حسب مجموع مسافات التحرير ثم حسب ترتيب الإدراج.
+        """
+        distances: Optional[Dict[str, int]] = None
+        
+        for word in query.split():
+            word_distances: Dict[str, int] = {}
+            for similar, distance in self._similar_words(word).items():
+                for notification_id in self._words[similar]:
+                    if distance < word_distances.get(notification_id, distance + 1):
+                        word_distances[notification_id] = distance
+            
+            if distances is None:
+                distances = word_distances
+            else:
+                distances = {
+                    notification_id: total + word_distances[notification_id]
+                    for notification_id, total in distances.items()
+                    if notification_id in word_distances
+                }
+            
+            if not distances:
+                return []
+        
+        order = self._order
+        
+        def rank(notification_id: str) -> Tuple[int, int]:
+            return distances[notification_id], order[notification_id]
+        
+        if limit:
+            return nsmallest(limit, distances, key=rank)
+        return sorted(distances, key=rank)
+
+class _ReminderQueue:
+    """
+    طابور التذكيرات المرتب حسب وقت التذكير (min-heap)
+    
+    يحتوي فقط على الإشعارات التي لم يُرسل تذكيرها. أوقات التذكير نصوص ISO
+    فتُقارن مباشرة دون تحليل. الإدخالات القديمة (بعد تغيير وقت التذكير أو
+    إرسال التذكير) تُهمل عند وصولها إلى رأس الطابور.
+    """
+    
+    def __init__(self, entries: Optional[List[Tuple[str, str]]] = None) -> None:
+        # القائمة المرتبة تصلح كـ heap مباشرة
+        self._heap: List[Tuple[str, str]] = sorted(entries or [])
+        self._live: Dict[str, str] = {notification_id: reminder_time for reminder_time, notification_id in self._heap}
+    
+    def put(self, notification: Dict[str, Any]) -> None:
+        """تحديث حالة إشعار في الطابور بعد إضافته أو تعديله"""
+        notification_id = notification["id"]
+        reminder_time = notification.get("reminder_time")
+        
+        if reminder_time and not notification.get("reminder_sent", False):
+            if self._live.get(notification_id) != reminder_time:
+                self._live[notification_id] = reminder_time
+                heappush(self._heap, (reminder_time, notification_id))
+        else:
+            self._live.pop(notification_id, None)
+        
+        self._compact_if_needed()
+    
+    def remove(self, notification_id: str) -> None:
+        """إزالة إشعار من الطابور"""
+        self._live.pop(notification_id, None)
+        self._compact_if_needed()
+    
+    def due(self, now: str, limit: Optional[int] = None) -> List[str]:
+        """
+        الحصول على الإشعارات التي حان وقت تذكيرها دون إزالتها من الطابور
+        
+        المعلمات:
+            now: الوقت الحالي بتنسيق ISO
+            limit: الحد الأقصى لعدد النتائج (اختياري)
+            
+        العائد:
+            معرفات الإشعارات المستحقة مرتبة من الأقدم
+        """
+        due: List[str] = []
+        seen: Set[str] = set()
+        popped: List[Tuple[str, str]] = []
+        
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+            reminder_time, notification_id = heappop(self._heap)
+            if self._live.get(notification_id) == reminder_time and notification_id not in seen:
+                due.append(notification_id)
+                seen.add(notification_id)
+                popped.append((reminder_time, notification_id))
+        
+        # إعادة الإدخالات الصالحة، فالتذكير يبقى مستحقاً حتى يُعلَّم بأنه أُرسل
+        for entry in popped:
+            heappush(self._heap, entry)
+        
+        return due
+    
+    def _compact_if_needed(self) -> None:
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = sorted((reminder_time, notification_id) for notification_id, reminder_time in self._live.items())
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    الحصول على اتصال قاعدة البيانات المشترك، وإنشاؤه عند أول استخدام
+    
+    العائد:
+        اتصال SQLite في وضع WAL
+    """
+    global _connection
+    
+    with _db_lock:
+        if _connection is None:
+            connection = sqlite3.connect(str(DATABASE_FILE), check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # كل كتابة تُلحق بسجل WAL فقط؛ synchronous=NORMAL آمن مع WAL ضد الأعطال
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # تعطيل الضغط التلقائي أثناء الكتابة، حيث يتولاه خيط الخلفية
+            connection.execute("PRAGMA wal_autocheckpoint=0")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.executescript(_SCHEMA)
+            _connection = connection
+        
+        return _connection
+
+def _index_values(notification: Dict[str, Any]) -> tuple:
+    """
+    استخراج قيم الأعمدة المفهرسة من سجل الإشعار
+    
+    المعلمات:
+        notification: بيانات الإشعار
+        
+    العائد:
+        صف القيم بنفس ترتيب أعمدة الجدول
+    """
+    return (
+        notification["id"],
+        json.dumps(notification, ensure_ascii=False, default=str),
+        notification.get("phone_number"),
+        notification.get("reminder_time"),
+        1 if notification.get("reminder_sent", False) else 0,
+        1 if notification.get("delivery_confirmed", False) else 0,
+    )
+
+def _insert_notification_rows(connection: sqlite3.Connection, notifications: List[Dict[str, Any]]) -> None:
+    """
+    إدراج أو تحديث مجموعة من الإشعارات دون تغيير ترتيب الإدراج الأصلي
+    
+    المعلمات:
+        connection: اتصال قاعدة البيانات
+        notifications: قائمة الإشعارات
+    """
+    connection.executemany(
+        """
+        INSERT INTO notifications (id, data, phone_number, reminder_time, reminder_sent, delivery_confirmed)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            data = excluded.data,
+            phone_number = excluded.phone_number,
+            reminder_time = excluded.reminder_time,
+            reminder_sent = excluded.reminder_sent,
+            delivery_confirmed = excluded.delivery_confirmed
+        """,
+        [_index_values(notification) for notification in notifications],
+    )
+
+def _ensure_cache() -> Dict[str, Dict[str, Any]]:
+    """
+    التأكد من أن الذاكرة المؤقتة للإشعارات محدّثة، وإعادة تحميلها عند الحاجة
+    
+    يُعاد التحميل فقط عند أول استخدام أو عندما يتغير data_version، أي عندما
+    يكتب اتصال آخر (عملية أخرى مثلاً) في قاعدة البيانات. كتابات هذه العملية
+    تمر عبر الذاكرة المؤقتة مباشرة ولا تتطلب إعادة تحميل.
+    يجب استدعاؤها مع الإمساك بـ _db_lock.
+    
+    العائد:
+        قاموس الإشعارات حسب المعرف
+    """
+    global _notifications_by_id, _notifications_list, _cache_data_version
+    global _phone_index, _name_index, _reminder_queue
+    
+    connection = _get_connection()
+    data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+    
+    if _notifications_by_id is None or data_version != _cache_data_version:
+        rows = connection.execute("SELECT id, data FROM notifications ORDER BY rowid").fetchall()
+        _notifications_by_id = {row[0]: json.loads(row[1]) for row in rows}
+        _notifications_list = None
+        _phone_index = _PhoneSuffixIndex(list(_notifications_by_id.values()))
+        _name_index = _NameTrigramIndex(list(_notifications_by_id.values()))
+        # بناء طابور التذكيرات من الفهرس الجزئي للتذكيرات غير المرسلة (مرتب مسبقاً)
+        _reminder_queue = _ReminderQueue(connection.execute(
+            "SELECT reminder_time, id FROM notifications WHERE reminder_sent = 0 AND reminder_time IS NOT NULL ORDER BY reminder_time"
+        ).fetchall())
+        _cache_data_version = data_version
+    
+    return _notifications_by_id
+
+def _cache_put(notifications: List[Dict[str, Any]]) -> None:
+    """
+    تحديث الذاكرة المؤقتة بعد كتابة ناجحة (write-through)
+    
+    المعلمات:
+        notifications: الإشعارات المكتوبة
+    """
+    global _notifications_list
+    
+    cache = _ensure_cache()
+    for notification in notifications:
+        cache[notification["id"]] = notification
+        _phone_index.put(notification["id"], notification.get("phone_number"))
+        _name_index.put(notification["id"], notification.get("customer_name"))
+        _reminder_queue.put(notification)
+    _notifications_list = None
+
+def _invalidate_cache() -> None:
+    """
+    إلغاء الذاكرة المؤقتة لإجبار إعادة التحميل عند القراءة التالية
+    """
+    global _notifications_by_id, _notifications_list
+    
+    with _db_lock:
+        _notifications_by_id = None
+        _notifications_list = None
+
+def checkpoint_database() -> bool:
+    """
+    ضغط سجل WAL في ملف قاعدة البيانات الرئيسي وتفريغه
+    
+    يستخدم الاتصال المشترك مع الإمساك بـ _db_lock: الضغط من اتصال منفصل يغير
+    data_version كما يراه الاتصال المشترك، فتُعاد قراءة الذاكرة المؤقتة
+    وفهارسها بالكامل من القرص عند القراءة التالية.
+    
+    العائد:
+        True إذا اكتمل الضغط بالكامل، False خلاف ذلك
+    """
+    try:
+        with _db_lock:
+            busy, _, _ = _get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return busy == 0
+    except Exception as e:
+        logger.error(f"Error checkpointing database: {e}")
+        return False
+
+def _run_wal_compactor() -> None:
+    """
+    حلقة خيط الخلفية: ضغط سجل WAL عند تجاوز عتبة الحجم أو المدة
+    """
+    last_checkpoint = time.monotonic()
+    poll_interval = max(1, min(10, WAL_CHECKPOINT_INTERVAL))
+    
+    while True:
+        time.sleep(poll_interval)
+        
+        try:
+            wal_size = WAL_FILE.stat().st_size if WAL_FILE.exists() else 0
+        except OSError:
+            wal_size = 0
+        
+        if wal_size == 0:
+            last_checkpoint = time.monotonic()
+            continue
+        
+        elapsed = time.monotonic() - last_checkpoint
+        if wal_size >= WAL_CHECKPOINT_BYTES or elapsed >= WAL_CHECKPOINT_INTERVAL:
+            if checkpoint_database():
+                logger.debug(f"Compacted {wal_size} bytes of WAL into the database")
+            last_checkpoint = time.monotonic()
+
+def start_wal_compactor() -> None:
+    """
+    تشغيل خيط ضغط سجل WAL في الخلفية (مرة واحدة لكل عملية)
+    """
+    global _compactor_thread
+    
+    with _db_lock:
+        if _compactor_thread is not None and _compactor_thread.is_alive():
+            return
+        
+        _compactor_thread = threading.Thread(target=_run_wal_compactor, name="wal-compactor", daemon=True)
+        _compactor_thread.start()
+
+def _write_json_atomic(path: Path, data: Any) -> None:
+    """
+    كتابة ملف JSON بشكل ذري عبر ملف مؤقت ثم استبداله
+    
+    المعلمات:
+        path: مسار الملف
+        data: البيانات المراد كتابتها
+    """
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def migrate_json_to_sqlite() -> int:
+    """
+    ترحيل الإشعارات من ملف JSON القديم إلى قاعدة بيانات SQLite (مرة واحدة)
+    
+    بعد نجاح الترحيل تتم إعادة تسمية الملف القديم إلى notifications.json.migrated
+    حتى لا يُعاد ترحيله في التشغيل التالي.
+    
+    العائد:
+        عدد الإشعارات التي تم ترحيلها
+    """
+    if not NOTIFICATIONS_FILE.exists():
+        return 0
+    
+    try:
+        with open(NOTIFICATIONS_FILE, 'r', encoding='utf-8') as f:
+            notifications = json.load(f)
+    except Exception as e:
+        logger.error(f"Error reading legacy notifications file: {e}")
+        return 0
+    
+    if notifications and not add_notifications_bulk(notifications):
+        logger.error("Error migrating notifications to SQLite, keeping the JSON file")
+        return 0
+    
+    try:
+        NOTIFICATIONS_FILE.rename(NOTIFICATIONS_FILE.with_name(NOTIFICATIONS_FILE.name + ".migrated"))
+        logger.info(f"Migrated {len(notifications)} notifications from JSON to SQLite")
+        return len(notifications)
+    except Exception as e:
+        logger.error(f"Error renaming legacy notifications file: {e}")
+        return len(notifications)
+
 def setup_database() -> None:
     """
     إعداد قاعدة البيانات وملفات التخزين الأولية
@@ -34,10 +801,12 @@ def setup_database() -> None:
         with open(ADMINS_FILE, 'w', encoding='utf-8') as f:
             json.dump([], f)
     
-    # إنشاء ملف الإشعارات إذا لم يكن موجوداً
-    if not NOTIFICATIONS_FILE.exists():
-        with open(NOTIFICATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f)
+    # إنشاء قاعدة بيانات الإشعارات وترحيل ملف JSON القديم إن وجد
+    # (يعيد SQLite تطبيق سجل WAL تلقائياً عند الفتح بعد أي توقف مفاجئ)
+    _get_connection()
+    migrate_json_to_sqlite()
+    normalize_stored_phone_numbers()
+    start_wal_compactor()
     
     # إنشاء ملف القوالب إذا لم يكن موجوداً
     if not TEMPLATES_FILE.exists():
@@ -62,8 +831,7 @@ def save_admins(admins: List[int]) -> bool:
         True إذا تم الحفظ بنجاح، False خلاف ذلك
     """
     try:
-        with open(ADMINS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(admins, f)
+        _write_json_atomic(ADMINS_FILE, admins)
         return True
     except Exception as e:
         logger.error(f"Error saving admins: {e}")
@@ -143,7 +911,7 @@ def reset_admins() -> bool:
 
 def save_notifications(notifications: List[Dict[str, Any]]) -> bool:
     """
-    حفظ قائمة الإشعارات
+    حفظ قائمة الإشعارات (استبدال جميع الإشعارات المخزنة)
     
     المعلمات:
         notifications: قائمة الإشعارات
@@ -152,8 +920,13 @@ def save_notifications(notifications: List[Dict[str, Any]]) -> bool:
         True إذا تم الحفظ بنجاح، False خلاف ذلك
     """
     try:
-        with open(NOTIFICATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(notifications, f, ensure_ascii=False, default=str)
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                connection.execute("DELETE FROM notifications")
+                _insert_notification_rows(connection, notifications)
+            _invalidate_cache()
+            _cache_put(notifications)
         return True
     except Exception as e:
         logger.error(f"Error saving notifications: {e}")
@@ -163,57 +936,123 @@ def get_notifications() -> List[Dict[str, Any]]:
     """
     الحصول على قائمة الإشعارات
     
+    تُقرأ القائمة من الذاكرة المؤقتة دون الوصول إلى القرص. السجلات مشتركة
+    مع الذاكرة المؤقتة ويجب عدم تعديلها مباشرة؛ استخدم update_notification.
+    
     العائد:
         قائمة الإشعارات
     """
+    global _notifications_list
+    
     try:
-        if not NOTIFICATIONS_FILE.exists():
-            return []
-        
-        with open(NOTIFICATIONS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with _db_lock:
+            cache = _ensure_cache()
+            if _notifications_list is None:
+                _notifications_list = list(cache.values())
+            return list(_notifications_list)
     except Exception as e:
         logger.error(f"Error loading notifications: {e}")
         return []
 
-def add_notification(customer_name: str, phone_number: str, image_path: str, reminder_days: int = 3) -> Dict[str, Any]:
+def _build_notification(record: Dict[str, Any]) -> Dict[str, Any]:
     """
-    إضافة إشعار جديد
+    إكمال سجل إشعار بالحقول الافتراضية (المعرف وأوقات الإنشاء والتذكير والحالة)
     
     المعلمات:
-        customer_name: اسم العميل
-        phone_number: رقم الهاتف
-        image_path: مسار الصورة
-        reminder_days: عدد أيام التذكير
+        record: بيانات الإشعار، والحقول الموجودة فيه لا تُستبدل
         
     العائد:
-        الإشعار المضاف
+        الإشعار الكامل
     """
-    notifications = get_notifications()
-    
-    notification_id = str(uuid.uuid4())
     created_at = datetime.now()
-    reminder_time = created_at + timedelta(days=reminder_days)
+    reminder_days = record.get("reminder_days", 3)
     
     notification = {
-        "id": notification_id,
-        "customer_name": customer_name,
-        "phone_number": phone_number,
-        "image_path": image_path,
+        "id": str(uuid.uuid4()),
+        "customer_name": record.get("customer_name"),
+        "phone_number": record.get("phone_number"),
+        "image_path": record.get("image_path"),
         "created_at": created_at.isoformat(),
-        "reminder_time": reminder_time.isoformat(),
+        "reminder_time": (created_at + timedelta(days=reminder_days)).isoformat(),
         "reminder_sent": False,
         "reminder_days": reminder_days,
         "delivery_confirmed": False,
         "delivery_date": None,
-        "delivery_proof_image": None
+        "delivery_proof_image": None,
+        "telegram_file_id": None
     }
+    notification.update(record)
+    
+    return notification
+
+def add_notification(customer_name: str, phone_number: str, image_path: str, reminder_days: int = 3,
+                     telegram_file_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    إضافة إشعار جديد
+    
+    المعلمات:
+        customer_name: اسم العميل
+        phone_number: رقم الهاتف
+        image_path: مسار الصورة
+        reminder_days: عدد أيام التذكير
+        telegram_file_id: معرف ملف الصورة على خوادم تيليجرام (اختياري)
+        
+    العائد:
+        الإشعار المضاف
+    """
+    notification = _build_notification({
+        "customer_name": customer_name,
+        "phone_number": normalize_phone(phone_number) or phone_number,
+        "image_path": image_path,
+        "reminder_days": reminder_days,
+        "telegram_file_id": telegram_file_id,
+    })
     
-    notifications.append(notification)
-    save_notifications(notifications)
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                _insert_notification_rows(connection, [notification])
+            _cache_put([notification])
+    except Exception as e:
+        logger.error(f"Error adding notification: {e}")
     
     return notification
 
+def add_notifications_bulk(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    إضافة مجموعة من الإشعارات في معاملة واحدة
+    
+    تُكمل الحقول الناقصة في كل سجل كما في add_notification، وتُحفظ الحقول
+    الموجودة كما هي (مثل المعرف عند الاستيراد). السجلات ذات المعرف الموجود
+    مسبقاً تُستبدل.
+    
+    المعلمات:
+        records: قائمة بيانات الإشعارات
+        
+    العائد:
+        قائمة الإشعارات المضافة، أو قائمة فارغة في حالة الخطأ
+    """
+    # توحيد أرقام الهواتف دفعة واحدة
+    phone_numbers = normalize_many(record.get("phone_number") for record in records)
+    notifications = [
+        _build_notification({**record, "phone_number": normalized or record.get("phone_number")})
+        for record, normalized in zip(records, phone_numbers)
+    ]
+    if not notifications:
+        return []
+    
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                _insert_notification_rows(connection, notifications)
+            _cache_put(notifications)
+        return notifications
+    except Exception as e:
+        logger.error(f"Error adding notifications in bulk: {e}")
+        return []
+
 def get_notification(notification_id: str) -> Optional[Dict[str, Any]]:
     """
     الحصول على إشعار بواسطة المعرف
@@ -224,13 +1063,12 @@ def get_notification(notification_id: str) -> Optional[Dict[str, Any]]:
     العائد:
         الإشعار إذا وجد، None خلاف ذلك
     """
-    notifications = get_notifications()
-    
-    for notification in notifications:
-        if notification["id"] == notification_id:
-            return notification
-    
-    return None
+    try:
+        with _db_lock:
+            return _ensure_cache().get(notification_id)
+    except Exception as e:
+        logger.error(f"Error loading notification {notification_id}: {e}")
+        return None
 
 def update_notification(notification_id: str, updates: Dict[str, Any]) -> bool:
     """
@@ -243,14 +1081,24 @@ def update_notification(notification_id: str, updates: Dict[str, Any]) -> bool:
     العائد:
         True إذا تم التحديث بنجاح، False خلاف ذلك
     """
-    notifications = get_notifications()
-    
-    for i, notification in enumerate(notifications):
-        if notification["id"] == notification_id:
-            notifications[i].update(updates)
-            return save_notifications(notifications)
+    if updates.get("phone_number"):
+        updates = {**updates, "phone_number": normalize_phone(updates["phone_number"]) or updates["phone_number"]}
     
-    return False
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            current = _ensure_cache().get(notification_id)
+            if current is None:
+                return False
+            
+            notification = {**current, **updates}
+            with connection:
+                _insert_notification_rows(connection, [notification])
+            _cache_put([notification])
+        return True
+    except Exception as e:
+        logger.error(f"Error updating notification {notification_id}: {e}")
+        return False
 
 def delete_notification(notification_id: str) -> bool:
     """
@@ -262,61 +1110,154 @@ def delete_notification(notification_id: str) -> bool:
     العائد:
         True إذا تم الحذف بنجاح، False خلاف ذلك
     """
-    notifications = get_notifications()
+    global _notifications_list
     
-    for i, notification in enumerate(notifications):
-        if notification["id"] == notification_id:
-            del notifications[i]
-            return save_notifications(notifications)
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            cache = _ensure_cache()
+            with connection:
+                cursor = connection.execute("DELETE FROM notifications WHERE id = ?", (notification_id,))
+            if cache.pop(notification_id, None) is not None:
+                _phone_index.remove(notification_id)
+                _name_index.remove(notification_id)
+                _reminder_queue.remove(notification_id)
+                _notifications_list = None
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"Error deleting notification {notification_id}: {e}")
+        return False
+
+def _update_notification_rows(connection: sqlite3.Connection, notification_ids: List[str], updates: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    تطبيق نفس التحديثات على مجموعة من الإشعارات ضمن معاملة مفتوحة
+    
+    يجب استدعاؤها مع الإمساك بـ _db_lock وداخل معاملة على connection. لا تُحدَّث
+    الذاكرة المؤقتة هنا؛ يمرر المستدعي النتيجة إلى _cache_put بعد نجاح المعاملة.
     
-    return False
+    المعلمات:
+        connection: اتصال قاعدة البيانات
+        notification_ids: معرفات الإشعارات
+        updates: التحديثات المطلوبة
+        
+    العائد:
+        الإشعارات بعد التحديث (المعرفات غير الموجودة تُتجاهل)
+    """
+    cache = _ensure_cache()
+    notifications = [
+        {**cache[notification_id], **updates}
+        for notification_id in dict.fromkeys(notification_ids)
+        if notification_id in cache
+    ]
+    if notifications:
+        _insert_notification_rows(connection, notifications)
+    return notifications
 
-def search_notifications_by_name(customer_name: str) -> List[Dict[str, Any]]:
+def update_notifications_bulk(notification_ids: List[str], updates: Dict[str, Any]) -> int:
     """
-    البحث عن الإشعارات بواسطة اسم العميل
+    تطبيق نفس التحديثات على مجموعة من الإشعارات في معاملة واحدة
     
     المعلمات:
-        customer_name: اسم العميل
+        notification_ids: معرفات الإشعارات
+        updates: التحديثات المطلوبة
         
     العائد:
-        قائمة الإشعارات المطابقة
+        عدد الإشعارات التي تم تحديثها
     """
-    notifications = get_notifications()
-    results = []
+    if updates.get("phone_number"):
+        updates = {**updates, "phone_number": normalize_phone(updates["phone_number"]) or updates["phone_number"]}
     
-    customer_name = customer_name.lower()
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                notifications = _update_notification_rows(connection, notification_ids, updates)
+            if notifications:
+                _cache_put(notifications)
+        return len(notifications)
+    except Exception as e:
+        logger.error(f"Error updating notifications in bulk: {e}")
+        return 0
+
+def search_notifications_by_name(customer_name: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    البحث عن الإشعارات بواسطة اسم العميل
     
-    for notification in notifications:
-        if customer_name in notification["customer_name"].lower():
-            results.append(notification)
+    يتجاهل البحث الفروق في التشكيل والتطويل وصور الألف والهمزة والتاء المربوطة،
+    ويعيد الأسماء المتشابهة إملائياً إذا لم توجد مطابقة مباشرة.
     
-    return results
+    المعلمات:
+        customer_name: اسم العميل
+        limit: الحد الأقصى لعدد النتائج (اختياري)
+        
+    العائد:
+        قائمة الإشعارات المطابقة مرتبة حسب الصلة
+    """
+    try:
+        with _db_lock:
+            cache = _ensure_cache()
+            return [cache[notification_id] for notification_id in _name_index.search(customer_name, limit)]
+    except Exception as e:
+        logger.error(f"Error searching notifications by name: {e}")
+        return []
 
 def search_notifications_by_phone(phone_number: str) -> List[Dict[str, Any]]:
     """
     البحث عن الإشعارات بواسطة رقم الهاتف
     
+    يُوحَّد الرقم المدخل أولاً ويُبحث عنه بمطابقة تامة في الفهرس. إذا لم توجد
+    نتائج (رقم جزئي مثلاً) تُطابق الإشعارات التي ينتهي رقمها بالرقم المدخل أو
+    التي ينتهي الرقم المدخل برقمها.
+    
     المعلمات:
         phone_number: رقم الهاتف
         
     العائد:
         قائمة الإشعارات المطابقة
     """
-    notifications = get_notifications()
-    results = []
+    canonical = phone_digits(phone_number)
     
-    # تنظيف رقم الهاتف من الأحرف غير الرقمية
-    phone_number = ''.join(filter(str.isdigit, phone_number))
+    try:
+        with _db_lock:
+            cache = _ensure_cache()
+            notification_ids = _phone_index.exact(canonical)
+            if not notification_ids:
+                # تنظيف رقم الهاتف من الأحرف غير الرقمية للبحث الجزئي
+                notification_ids = _phone_index.search(only_digits(phone_number))
+            return [cache[notification_id] for notification_id in notification_ids]
+    except Exception as e:
+        logger.error(f"Error searching notifications by phone: {e}")
+        return []
+
+def normalize_stored_phone_numbers() -> int:
+    """
+    توحيد أرقام الهواتف المخزنة بصيغ قديمة (تُنفذ عند الإعداد، ولا تغير الأرقام الموحدة)
     
-    for notification in notifications:
-        # تنظيف رقم الهاتف المخزن من الأحرف غير الرقمية
-        stored_phone = ''.join(filter(str.isdigit, notification["phone_number"]))
+    العائد:
+        عدد الإشعارات التي تم تحديثها
+    """
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            current = list(_ensure_cache().values())
+            phone_numbers = normalize_many(notification.get("phone_number") for notification in current)
+            notifications = [
+                {**notification, "phone_number": normalized}
+                for notification, normalized in zip(current, phone_numbers)
+                if normalized and normalized != notification.get("phone_number")
+            ]
+            if not notifications:
+                return 0
+            
+            with connection:
+                _insert_notification_rows(connection, notifications)
+            _cache_put(notifications)
         
-        # البحث عن التطابق الجزئي في آخر الرقم
-        if stored_phone.endswith(phone_number) or phone_number.endswith(stored_phone):
-            results.append(notification)
-    
-    return results
+        logger.info(f"Normalized phone numbers of {len(notifications)} notifications")
+        return len(notifications)
+    except Exception as e:
+        logger.error(f"Error normalizing stored phone numbers: {e}")
+        return 0
 
 def get_templates() -> Dict[str, str]:
     """
@@ -363,8 +1304,7 @@ def update_template(template_name: str, template_text: str) -> bool:
         templates = get_templates()
         templates[template_name] = template_text
         
-        with open(TEMPLATES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(templates, f, ensure_ascii=False)
+        _write_json_atomic(TEMPLATES_FILE, templates)
         
         return True
     except Exception as e:
@@ -378,29 +1318,36 @@ def get_notification_count() -> int:
     العائد:
         عدد الإشعارات
     """
-    return len(get_notifications())
+    try:
+        with _db_lock:
+            return len(_ensure_cache())
+    except Exception as e:
+        logger.error(f"Error counting notifications: {e}")
+        return 0
 
-def get_pending_reminders() -> List[Dict[str, Any]]:
+def get_pending_reminders(limit: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     الحصول على قائمة الإشعارات التي تحتاج إلى إرسال تذكير
     
-    العائد:
-        قائمة الإشعارات التي تحتاج إلى تذكير
-    """
-    notifications = get_notifications()
-    now = datetime.now()
-    pending_reminders = []
+    تُقرأ من طابور التذكيرات في الذاكرة، فتكون التكلفة متناسبة مع عدد
+    التذكيرات المستحقة فقط.
     
-    for notification in notifications:
-        if notification.get("reminder_sent", False):
-            continue
-        
-        reminder_time = datetime.fromisoformat(notification["reminder_time"])
+    المعلمات:
+        limit: الحد الأقصى لعدد التذكيرات المعادة (اختياري)
         
-        if reminder_time <= now:
-            pending_reminders.append(notification)
+    العائد:
+        قائمة الإشعارات التي تحتاج إلى تذكير مرتبة من الأقدم
+    """
+    # أوقات التذكير مخزنة بتنسيق ISO، لذا تكفي المقارنة النصية
+    now = datetime.now().isoformat()
     
-    return pending_reminders
+    try:
+        with _db_lock:
+            cache = _ensure_cache()
+            return [cache[notification_id] for notification_id in _reminder_queue.due(now, limit)]
+    except Exception as e:
+        logger.error(f"Error loading pending reminders: {e}")
+        return []
 
 def mark_reminder_sent(notification_id: str) -> bool:
     """
@@ -433,4 +1380,302 @@ def mark_delivery_confirmed(notification_id: str, proof_image_path: Optional[str
     if proof_image_path:
         updates["delivery_proof_image"] = proof_image_path
     
-    return update_notification(notification_id, updates)
\ No newline at end of file
+    return update_notification(notification_id, updates)
+
+def enqueue_outbox_messages(messages: List[Dict[str, Any]], reminder_ids: Optional[List[str]] = None) -> bool:
+    """
+    إضافة رسائل صادرة إلى صندوق الرسائل في معاملة واحدة
+    
+    الرسائل ذات مفتاح عدم التكرار الموجود مسبقاً تُتجاهل. إذا مُررت reminder_ids
+    تُعلَّم إشعاراتها بأنه تم إرسال تذكير لها في نفس المعاملة، فلا يمكن أن
+    يُعلَّم تذكير دون جدولة رسائله أو العكس.
+    
+    المعلمات:
+        messages: قائمة الرسائل، كل منها يحتوي على idempotency_key وnotification_id
+            وmessage_type وrecipient وbody وmedia_url (اختياري: مسارات الصور المحلية
+            التي تُحوَّل إلى روابط عند الإرسال)
+        reminder_ids: معرفات الإشعارات التي تُعلَّم بإرسال التذكير (اختياري)
+        
+    العائد:
+        True إذا تمت الجدولة بنجاح، False خلاف ذلك
+    """
+    now = datetime.now().isoformat()
+    rows = [
+        (
+            message["idempotency_key"],
+            message["notification_id"],
+            message["message_type"],
+            message["recipient"],
+            message["body"],
+            json.dumps(message["media_url"]) if message.get("media_url") else None,
+            now,
+            now,
+            now,
+        )
+        for message in messages
+    ]
+    
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                connection.executemany(
+                    """
+                    INSERT OR IGNORE INTO outbox (
+                        idempotency_key, notification_id, message_type, recipient, body, media_url,
+                        next_attempt_at, created_at, updated_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
+                )
+                notifications = _update_notification_rows(connection, reminder_ids or [], {"reminder_sent": True})
+            
+            if notifications:
+                _cache_put(notifications)
+        return True
+    except Exception as e:
+        logger.error(f"Error enqueueing outbox messages: {e}")
+        return False
+
+def claim_outbox_messages(limit: int) -> List[Dict[str, Any]]:
+    """
+    حجز الرسائل الصادرة المستحقة للإرسال
+    
+    تُنقل الرسائل إلى حالة sending لمدة OUTBOX_LEASE_SECONDS؛ إذا توقفت العملية
+    قبل تسجيل نتيجة الإرسال تعود الرسالة مستحقة بعد انتهاء المدة، إلا إذا كانت
+    قد استنفدت OUTBOX_MAX_ATTEMPTS محاولة فتُنقل إلى حالة dead.
+    
+    المعلمات:
+        limit: الحد الأقصى لعدد الرسائل
+        
+    العائد:
+        قائمة الرسائل المحجوزة مرتبة من الأقدم استحقاقاً
+    """
+    now = datetime.now()
+    lease_until = (now + timedelta(seconds=OUTBOX_LEASE_SECONDS)).isoformat()
+    now = now.isoformat()
+    
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                # رسائل انتهت مدة حجزها دون نتيجة بعد استنفاد المحاولات (توقف العامل أثناء الإرسال مثلاً)
+                dead = connection.execute(
+                    """
+                    UPDATE outbox
+                    SET status = 'dead', last_error = COALESCE(last_error, 'Lease expired without a result'), updated_at = ?
+                    WHERE status = 'sending' AND next_attempt_at <= ? AND attempts >= ?
+                    """,
+                    (now, now, OUTBOX_MAX_ATTEMPTS),
+                ).rowcount
+                if dead:
+                    logger.warning(f"Moved {dead} outbox messages with expired leases to dead after {OUTBOX_MAX_ATTEMPTS} attempts")
+                
+                rows = connection.execute(
+                    """
+                    SELECT idempotency_key, notification_id, message_type, recipient, body, media_url, attempts
+                    FROM outbox
+                    WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                    """,
+                    (now, limit),
+                ).fetchall()
+                connection.executemany(
+                    """
+                    UPDATE outbox
+                    SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?, updated_at = ?
+                    WHERE idempotency_key = ?
+                    """,
+                    [(lease_until, now, row[0]) for row in rows],
+                )
+        
+        return [
+            {
+                "idempotency_key": row[0],
+                "notification_id": row[1],
+                "message_type": row[2],
+                "recipient": row[3],
+                "body": row[4],
+                "media_url": json.loads(row[5]) if row[5] else None,
+                "attempts": row[6] + 1,
+            }
+            for row in rows
+        ]
+    except Exception as e:
+        logger.error(f"Error claiming outbox messages: {e}")
+        return []
+
+def complete_outbox_message(idempotency_key: str, provider_sid: Optional[str] = None) -> bool:
+    """
+    تعليم رسالة صادرة بأنها أُرسلت
+    
+    المعلمات:
+        idempotency_key: مفتاح عدم التكرار للرسالة
+        provider_sid: معرف الرسالة لدى مزود الخدمة (اختياري)
+        
+    العائد:
+        True إذا تم التعليم بنجاح، False خلاف ذلك
+    """
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                connection.execute(
+                    """
+                    UPDATE outbox
+                    SET status = 'sent', provider_sid = ?, last_error = NULL, updated_at = ?
+                    WHERE idempotency_key = ?
+                    """,
+                    (provider_sid, datetime.now().isoformat(), idempotency_key),
+                )
+        return True
+    except Exception as e:
+        logger.error(f"Error completing outbox message {idempotency_key}: {e}")
+        return False
+
+def fail_outbox_message(idempotency_key: str, error: str) -> Optional[str]:
+    """
+    تسجيل فشل إرسال رسالة صادرة وجدولة إعادة المحاولة
+    
+    يتضاعف تأخير إعادة المحاولة مع كل محاولة حتى OUTBOX_RETRY_MAX_DELAY، وبعد
+    OUTBOX_MAX_ATTEMPTS محاولة تُنقل الرسالة إلى حالة dead ولا يُعاد إرسالها.
+    
+    المعلمات:
+        idempotency_key: مفتاح عدم التكرار للرسالة
+        error: وصف الخطأ
+        
+    العائد:
+        الحالة الجديدة للرسالة (pending أو dead)، أو None في حالة الخطأ
+    """
+    now = datetime.now()
+    
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            row = connection.execute(
+                "SELECT attempts FROM outbox WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            attempts = row[0]
+            status = "dead" if attempts >= OUTBOX_MAX_ATTEMPTS else "pending"
+            delay = min(OUTBOX_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), OUTBOX_RETRY_MAX_DELAY)
+            
+            with connection:
+                connection.execute(
+                    """
+                    UPDATE outbox
+                    SET status = ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+                    WHERE idempotency_key = ?
+                    """,
+                    (status, (now + timedelta(seconds=delay)).isoformat(), error, now.isoformat(), idempotency_key),
+                )
+        return status
+    except Exception as e:
+        logger.error(f"Error recording outbox failure for {idempotency_key}: {e}")
+        return None
+
+def get_cached_image_analysis(image_hash: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    الحصول على نتيجة تحليل صورة محفوظة مسبقاً
+    
+    المعلمات:
+        image_hash: بصمة SHA-256 لمحتوى الصورة
+        
+    العائد:
+        زوج (نص التحليل، المعلومات المستخرجة) إذا وجدت نتيجة صالحة، None خلاف ذلك
+    """
+    now = datetime.now()
+    oldest = (now - timedelta(seconds=AI_IMAGE_CACHE_TTL)).isoformat()
+    
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            row = connection.execute(
+                "SELECT analysis, extracted_data FROM ai_image_cache WHERE image_hash = ? AND created_at >= ?",
+                (image_hash, oldest),
+            ).fetchone()
+            if row is None:
+                return None
+            
+            # تحديث وقت آخر استخدام لترتيب الإزالة حسب الأقدم استخداماً
+            with connection:
+                connection.execute(
+                    "UPDATE ai_image_cache SET last_used_at = ? WHERE image_hash = ?",
+                    (now.isoformat(), image_hash),
+                )
+        return row[0], json.loads(row[1])
+    except Exception as e:
+        logger.error(f"Error reading image analysis cache: {e}")
+        return None
+
+def cache_image_analysis(image_hash: str, analysis: str, extracted_data: Dict[str, str]) -> bool:
+    """
+    حفظ نتيجة تحليل صورة
+    
+    تُحذف النتائج المنتهية الصلاحية، وإذا تجاوز عدد النتائج AI_IMAGE_CACHE_MAX_ENTRIES
+    تُحذف الأقدم استخداماً.
+    
+    المعلمات:
+        image_hash: بصمة SHA-256 لمحتوى الصورة
+        analysis: نص التحليل
+        extracted_data: المعلومات المستخرجة من التحليل
+        
+    العائد:
+        True إذا تم الحفظ بنجاح، False خلاف ذلك
+    """
+    now = datetime.now()
+    oldest = (now - timedelta(seconds=AI_IMAGE_CACHE_TTL)).isoformat()
+    
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            with connection:
+                connection.execute(
+                    """
+                    INSERT OR REPLACE INTO ai_image_cache (image_hash, analysis, extracted_data, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (image_hash, analysis, json.dumps(extracted_data, ensure_ascii=False), now.isoformat(), now.isoformat()),
+                )
+                connection.execute("DELETE FROM ai_image_cache WHERE created_at < ?", (oldest,))
+                
+                count = connection.execute("SELECT COUNT(*) FROM ai_image_cache").fetchone()[0]
+                if count > AI_IMAGE_CACHE_MAX_ENTRIES:
+                    connection.execute(
+                        """
+                        DELETE FROM ai_image_cache WHERE image_hash IN (
+                            SELECT image_hash FROM ai_image_cache ORDER BY last_used_at LIMIT ?
+                        )
+                        """,
+                        (count - AI_IMAGE_CACHE_MAX_ENTRIES,),
+                    )
+        return True
+    except Exception as e:
+        logger.error(f"Error writing image analysis cache: {e}")
+        return False
+
+def get_cached_analysis_texts(limit: int = 1000) -> List[str]:
+    """
+    الحصول على نصوص التحليل المحفوظة (تُستخدم لقياس أداء الاستخراج على نصوص حقيقية)
+    
+    المعلمات:
+        limit: الحد الأقصى لعدد النصوص
+        
+    العائد:
+        قائمة بنصوص التحليل، الأحدث أولاً
+    """
+    try:
+        connection = _get_connection()
+        with _db_lock:
+            rows = connection.execute(
+                "SELECT analysis FROM ai_image_cache ORDER BY created_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [row[0] for row in rows]
+    except Exception as e:
+        logger.error(f"Error reading image analysis cache: {e}")
+        return []
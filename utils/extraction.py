@@ -0,0 +1,184 @@
+"""
+استخراج معلومات الشحنات وأرقام الهواتف من النصوص بأنماط مترجمة مسبقاً
+"""
+
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.phones import normalize_phone
+
+# الحقول المستخرجة بترتيبها في النتيجة، ولكل حقل أنماطه مرتبة حسب الأولوية
+FIELD_PATTERNS: List[Tuple[str, List[str]]] = [
+    ("customer_name", [
+        r"اسم العميل:?\s*([^\n:;,،]+)",
+        r"اسم المستلم:?\s*([^\n:;,،]+)",
+        r"العميل:?\s*([^\n:;,،]+)",
+        r"المستلم:?\s*([^\n:;,،]+)",
+        r"اسم:?\s*([^\n:;,،]+)",
+    ]),
+    ("phone_number", [
+        r"رقم الهاتف:?\s*([+\d \t\-()]+)",
+        r"الهاتف:?\s*([+\d \t\-()]+)",
+        r"رقم الجوال:?\s*([+\d \t\-()]+)",
+        r"الجوال:?\s*([+\d \t\-()]+)",
+        r"رقم:?\s*([+\d \t\-()]+)",
+        r"(\+?90\d{10})",
+        r"(\+?963\d{9})",
+        r"(\d{10,11})",
+    ]),
+    ("shipping_date", [
+        r"تاريخ الشحن:?\s*([^\n:;,،]+)",
+        r"تاريخ:?\s*([^\n:;,،]+)",
+        r"(\d{4}-\d{2}-\d{2})",
+        r"(\d{2}/\d{2}/\d{4})",
+        r"(\d{2}-\d{2}-\d{4})",
+    ]),
+    ("destination", [
+        r"وجهة الشحنة:?\s*([^\n:;,،]+)",
+        r"الوجهة:?\s*([^\n:;,،]+)",
+        r"المدينة:?\s*([^\n:;,،]+)",
+        r"العنوان:?\s*([^\n:;,،]+)",
+        r"مدينة:?\s*([^\n:;,،]+)",
+    ]),
+    ("value", [
+        r"قيمة الشحنة:?\s*([^\n:;,،]+)",
+        r"قيمة:?\s*([^\n:;,،]+)",
+        r"المبلغ:?\s*([^\n:;,،]+)",
+        r"السعر:?\s*([^\n:;,،]+)",
+        r"(\d+(?:,\d+)*(?:\.\d+)?\s*(?:ليرة|ل\.س|دولار|\$|TL|₺))",
+    ]),
+]
+
+# أنماط أرقام الهواتف في النص الحر، من الأكثر تحديداً إلى الأعم
+PHONE_PATTERNS = [
+    r"\+?90\d{10}",  # رقم تركي مع رمز البلد
+    r"\+?963\d{9}",  # رقم سوري مع رمز البلد
+    r"0?9\d{8}",     # رقم سوري بدون رمز البلد
+    r"0?5\d{9}",     # رقم تركي بدون رمز البلد
+    r"\d{10,11}",    # أي رقم هاتف عام
+]
+
+# الأنماط مترجمة مرة واحدة عند تحميل الوحدة.
+# أنماط الحقول تبقى منفصلة: كل نمط له بادئة نصية ثابتة يبحث عنها محرك re بسرعة،
+# بينما التعبير المدمج منها يُجرب جميع البدائل عند كل موضع في النص فيكون أبطأ.
+_FIELD_REGEXES = [
+    (field, [re.compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in patterns])
+    for field, patterns in FIELD_PATTERNS
+]
+
+# أنماط الهواتف مدمجة في تعبير واحد يُمسح به النص مرة واحدة، فلا تُلتقط أجزاء من الرقم
+# نفسه كأرقام إضافية. شرط البداية (?=[+\d]) يتخطى الأحرف الأخرى دون تجريب البدائل عندها.
+_PHONE_REGEX = re.compile(r"(?=[+\d])(?:" + "|".join(PHONE_PATTERNS) + ")")
+
+def extract_shipping_info(analysis_text: str) -> Dict[str, str]:
+    """
+    استخراج معلومات الشحنة من نص التحليل
+    
+    لكل حقل تُجرب أنماطه حسب الأولوية ويُكتفى بأول نمط يعطي قيمة صالحة.
+    
+    المعلمات:
+        analysis_text: نص التحليل
+    
+    العائد:
+        قاموس يحتوي على المعلومات المستخرجة
+    """
+    extracted_data = {}
+    
+    for field, regexes in _FIELD_REGEXES:
+        for regex in regexes:
+            match = regex.search(analysis_text)
+            if not match:
+                continue
+            
+            value = match.group(1).strip()
+            if field == "customer_name" and not 3 <= len(value) <= 50:  # التحقق من أن الاسم منطقي
+                continue
+            if field == "phone_number":
+                value = normalize_phone(value)
+                if not value.lstrip("+"):
+                    continue
+            
+            extracted_data[field] = value
+            break
+    
+    return extracted_data
+
+def extract_phone_numbers(text: str) -> List[str]:
+    """
+    استخراج أرقام الهواتف من النص
+    
+    المعلمات:
+        text: النص المراد البحث فيه
+    
+    العائد:
+        قائمة بأرقام الهواتف المستخرجة بترتيب ظهورها، دون تكرار
+    """
+    phone_numbers = []
+    seen = set()
+    
+    for match in _PHONE_REGEX.finditer(text):
+        phone_number = normalize_phone(match.group())
+        if phone_number not in seen:
+            seen.add(phone_number)
+            phone_numbers.append(phone_number)
+    
+    return phone_numbers
+
+# نصوص تحليل نموذجية للقياس إذا لم تتوفر نتائج محفوظة
+SAMPLE_ANALYSES = [
+    (
+        "تحليل صورة الشحنة:\n"
+        "1. اسم العميل: محمد أحمد الخطيب\n"
+        "2. رقم الهاتف: 0933 123 456\n"
+        "3. تاريخ الشحن: 2024-03-15\n"
+        "4. وجهة الشحنة: دمشق - المزة\n"
+        "5. قيمة الشحنة: 250,000 ليرة\n\n"
+        "تظهر الصورة ملصق شحن مطبوع على صندوق كرتوني مع رمز باركود."
+    ),
+    (
+        "الصورة تحتوي على إيصال شحن.\n"
+        "- المستلم: Ayşe Yılmaz\n"
+        "- الجوال: +90 532 123 45 67\n"
+        "- التاريخ: 03/04/2024\n"
+        "- العنوان: إسطنبول، الفاتح\n"
+        "- المبلغ: 1.250 TL\n"
+        "لا توجد معلومات إضافية واضحة في الصورة."
+    ),
+    (
+        "لم أتمكن من قراءة اسم العميل بوضوح. يظهر رقم 963944556677 في أسفل الملصق، "
+        "وتاريخ 12-05-2024، والمدينة: حلب. القيمة غير مذكورة."
+    ),
+]
+
+def benchmark(texts: Optional[List[str]] = None, rounds: int = 200) -> Dict[str, float]:
+    """
+    قياس زمن الاستخراج
+    
+    المعلمات:
+        texts: نصوص التحليل (الافتراضي: نتائج التحليل المحفوظة، أو النصوص النموذجية)
+        rounds: عدد مرات تكرار المجموعة
+    
+    العائد:
+        متوسط زمن كل دالة بالميكروثانية لكل نص
+    """
+    if not texts:
+        from utils.database import get_cached_analysis_texts
+        texts = get_cached_analysis_texts() or SAMPLE_ANALYSES
+    
+    results: Dict[str, float] = {"texts": len(texts)}
+    for function in (extract_shipping_info, extract_phone_numbers):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for text in texts:
+                function(text)
+        results[function.__name__] = (time.perf_counter() - started) / (rounds * len(texts)) * 1e6
+    
+    return results
+
+if __name__ == "__main__":
+    # python -m utils.extraction
+    results = benchmark()
+    print(f"texts: {results.pop('texts')}")
+    for name, result in results.items():
+        print(f"{name}: {result:.1f} µs/text")
@@ -0,0 +1,157 @@
+"""
+تجهيز الصور لنماذج الرؤية - تصحيح الاتجاه وتصغير الحجم وتحسين التباين وإعادة الضغط قبل الإرسال
+"""
+
+import asyncio
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+
+# استيراد Pillow إذا كان موجوداً
+try:
+    from PIL import Image, ImageOps
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+# أنسب طول للضلع الأطول لكل مزود؛ الصور الأكبر يصغّرها المزود نفسه بعد دفع تكلفة رفعها
+PROVIDER_LONG_EDGE = {
+    "openai": 2048,
+    "anthropic": 1568,
+}
+DEFAULT_LONG_EDGE = 1568
+
+# جودة ضغط JPEG، كافية لقراءة نصوص الملصقات
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", 85))
+
+# عدد خيوط تجهيز الصور
+IMAGE_PREP_WORKERS = int(os.environ.get("IMAGE_PREP_WORKERS", 2))
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_PREP_WORKERS, thread_name_prefix="image-prep")
+
+# إحصائيات طلبات الرؤية لكل مزود
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+def _prepare(image_path: str, long_edge: int) -> bytes:
+    """
+    تجهيز الصورة (يُنفذ في خيط من مجموعة الخيوط)
+    
+    المعلمات:
+        image_path: مسار الصورة
+        long_edge: الحد الأقصى لطول الضلع الأطول بالبكسل
+    
+    العائد:
+        بايتات الصورة بتنسيق JPEG
+    """
+    with Image.open(image_path) as image:
+        # تطبيق اتجاه EXIF حتى لا تصل الملصقات مقلوبة
+        image = ImageOps.exif_transpose(image)
+        
+        # تدرج رمادي مع تمديد التباين، وهو ما يكفي لقراءة الملصقات
+        image = ImageOps.autocontrast(image.convert("L"), cutoff=1)
+        
+        # التصغير مع الحفاظ على النسبة، دون تكبير الصور الصغيرة
+        image.thumbnail((long_edge, long_edge), Image.LANCZOS)
+        
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return output.getvalue()
+
+def _read(image_path: str) -> bytes:
+    with open(image_path, "rb") as f:
+        return f.read()
+
+async def prepare_image(image_path: str, provider: str) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    تجهيز صورة لإرسالها إلى نموذج رؤية
+    
+    إذا لم تكن Pillow متاحة، أو فشل التجهيز، أو كانت النتيجة أكبر من الأصل،
+    تُعاد الصورة الأصلية كما هي.
+    
+    المعلمات:
+        image_path: مسار الصورة
+        provider: اسم المزود (openai أو anthropic)
+    
+    العائد:
+        زوج (بايتات الصورة، معلومات التجهيز: original_bytes وprepared_bytes وprep_seconds)
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    
+    original = await loop.run_in_executor(_executor, _read, image_path)
+    prepared = original
+    
+    if PILLOW_AVAILABLE:
+        long_edge = PROVIDER_LONG_EDGE.get(provider, DEFAULT_LONG_EDGE)
+        try:
+            result = await loop.run_in_executor(_executor, _prepare, image_path, long_edge)
+            if len(result) < len(original):
+                prepared = result
+        except Exception as e:
+            logger.error(f"Error preparing image {image_path}: {e}")
+    
+    info = {
+        "original_bytes": len(original),
+        "prepared_bytes": len(prepared),
+        "prep_seconds": time.perf_counter() - started,
+    }
+    return prepared, info
+
+def record_vision_call(provider: str, info: Dict[str, Any], request_seconds: float, success: bool) -> None:
+    """
+    تسجيل إحصائيات طلب رؤية
+    
+    المعلمات:
+        provider: اسم المزود
+        info: معلومات التجهيز التي أعادتها prepare_image
+        request_seconds: زمن الطلب بالثواني
+        success: هل نجح الطلب
+    """
+    with _stats_lock:
+        stats = _stats.setdefault(provider, {
+            "calls": 0,
+            "failures": 0,
+            "original_bytes": 0,
+            "prepared_bytes": 0,
+            "prep_seconds": 0.0,
+            "request_seconds": 0.0,
+        })
+        stats["calls"] += 1
+        stats["failures"] += 0 if success else 1
+        stats["original_bytes"] += info["original_bytes"]
+        stats["prepared_bytes"] += info["prepared_bytes"]
+        stats["prep_seconds"] += info["prep_seconds"]
+        stats["request_seconds"] += request_seconds
+
+def get_vision_stats() -> Dict[str, Dict[str, float]]:
+    """
+    الحصول على إحصائيات طلبات الرؤية لكل مزود منذ بدء التشغيل
+    
+    العائد:
+        قاموس حسب المزود يحتوي على عدد الطلبات والإخفاقات والبايتات الموفرة
+        ومتوسط زمن التجهيز والطلب بالثواني
+    """
+    report = {}
+    
+    with _stats_lock:
+        for provider, stats in _stats.items():
+            calls = stats["calls"] or 1
+            report[provider] = {
+                "calls": stats["calls"],
+                "failures": stats["failures"],
+                "original_bytes": stats["original_bytes"],
+                "prepared_bytes": stats["prepared_bytes"],
+                "bytes_saved": stats["original_bytes"] - stats["prepared_bytes"],
+                "avg_prep_seconds": stats["prep_seconds"] / calls,
+                "avg_request_seconds": stats["request_seconds"] / calls,
+            }
+    
+    return report
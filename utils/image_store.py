@@ -0,0 +1,143 @@
+"""
+مخزن صور الإشعارات - حفظ الصور بأسماء مشتقة من محتواها مع نسخ مصغرة ومتوسطة تُنشأ في الخلفية
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# استيراد Pillow إذا كان موجوداً
+try:
+    from PIL import Image, ImageOps
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+# المجلد الحالي
+current_dir = Path(__file__).parent.parent.absolute()
+IMAGES_DIR = current_dir / "data" / "images"
+
+# النسخ المشتقة وطول الضلع الأطول لكل منها بالبكسل:
+# thumb للوحة التحكم، medium لإرسال الصور عبر تيليجرام وTwilio (تيليجرام يصغّر الصور إلى 1280 على أي حال)
+RENDITIONS = {
+    "thumb": 320,
+    "medium": 1280,
+}
+RENDITION_JPEG_QUALITY = 82
+
+# عدد خيوط إنشاء النسخ المشتقة
+IMAGE_STORE_WORKERS = int(os.environ.get("IMAGE_STORE_WORKERS", 2))
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_STORE_WORKERS, thread_name_prefix="image-store")
+
+def rendition_path(image_path: str, rendition: str) -> str:
+    """
+    مسار نسخة مشتقة من صورة الإشعار
+    
+    إذا لم تكن النسخة موجودة (صورة قديمة، أو الصورة الأصلية أصغر من حجم النسخة،
+    أو لم يكتمل إنشاؤها بعد) يُعاد مسار الصورة الأصلية.
+    
+    المعلمات:
+        image_path: مسار الصورة الأصلية النسبي (مثل data/images/<hash>.jpg)
+        rendition: اسم النسخة (thumb أو medium أو original)
+    
+    العائد:
+        المسار النسبي للنسخة المطلوبة أو للصورة الأصلية
+    """
+    if rendition == "original" or not image_path:
+        return image_path
+    
+    path = Path(image_path)
+    candidate = path.with_name(f"{path.stem}_{rendition}{path.suffix}")
+    if (current_dir / candidate).exists():
+        return candidate.as_posix()
+    
+    return image_path
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # اسم مؤقت خاص بالخيط حتى لا تتداخل كتابتان متزامنتان لنفس الصورة
+    temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+def _save_original(data: bytes) -> Path:
+    """
+    حفظ الصورة الأصلية باسم مشتق من بصمة محتواها (يُنفذ في خيط)
+    
+    العائد:
+        المسار الكامل للصورة (الصورة المكررة لا تُكتب مرة أخرى)
+    """
+    IMAGES_DIR.mkdir(exist_ok=True, parents=True)
+    path = IMAGES_DIR / f"{hashlib.sha256(data).hexdigest()}.jpg"
+    
+    if not path.exists():
+        _write_atomic(path, data)
+    
+    return path
+
+def _generate_renditions(path: Path) -> None:
+    """
+    إنشاء النسخ المشتقة الناقصة لصورة (يُنفذ في خيط من مجموعة الخيوط)
+    
+    المعلمات:
+        path: المسار الكامل للصورة الأصلية
+    """
+    try:
+        with Image.open(path) as original:
+            # تطبيق اتجاه EXIF قبل التصغير
+            image = ImageOps.exif_transpose(original).convert("RGB")
+            
+            for rendition, long_edge in RENDITIONS.items():
+                target = path.with_name(f"{path.stem}_{rendition}{path.suffix}")
+                if target.exists() or max(image.size) <= long_edge:
+                    continue
+                
+                resized = image.copy()
+                resized.thumbnail((long_edge, long_edge), Image.LANCZOS)
+                
+                output = io.BytesIO()
+                resized.save(output, format="JPEG", quality=RENDITION_JPEG_QUALITY, optimize=True)
+                _write_atomic(target, output.getvalue())
+    except Exception as e:
+        logger.error(f"Error generating renditions for {path.name}: {e}")
+
+async def store_image(data: bytes) -> str:
+    """
+    حفظ صورة إشعار في المخزن
+    
+    تُحفظ الصورة الأصلية قبل العودة، وتُنشأ النسخ المشتقة في الخلفية.
+    
+    المعلمات:
+        data: بايتات الصورة
+    
+    العائد:
+        المسار النسبي للصورة الأصلية (يُخزن في image_path)
+    """
+    loop = asyncio.get_running_loop()
+    path = await loop.run_in_executor(_executor, _save_original, data)
+    
+    if PILLOW_AVAILABLE:
+        _executor.submit(_generate_renditions, path)
+    
+    return path.relative_to(current_dir).as_posix()
+
+async def store_image_file(source_path: str) -> str:
+    """
+    حفظ ملف صورة موجود في المخزن (مثل صورة من المجلد المؤقت)
+    
+    المعلمات:
+        source_path: المسار الكامل لملف الصورة
+    
+    العائد:
+        المسار النسبي للصورة الأصلية
+    """
+    data = await asyncio.to_thread(Path(source_path).read_bytes)
+    return await store_image(data)
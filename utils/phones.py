@@ -0,0 +1,100 @@
+"""
+توحيد أرقام الهواتف - تحويل الأرقام المدخلة بأي صيغة إلى صيغة E.164 موحدة قبل التخزين والبحث
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# رموز البلدان المدعومة مع البادئة المحلية لأرقام الجوال وطول الرقم الوطني (بدون الصفر)
+# سوريا: 09xxxxxxxx، تركيا: 05xxxxxxxxx
+COUNTRIES: List[Tuple[str, str, int]] = [
+    ("963", "9", 9),
+    ("90", "5", 10),
+]
+
+# تحويل الأرقام العربية الهندية والفارسية إلى أرقام لاتينية
+_DIGITS_TRANSLATION = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+def only_digits(phone_number: Optional[str]) -> str:
+    """
+    أرقام النص فقط (بعد تحويل الأرقام العربية إلى لاتينية) دون أي توحيد
+    
+    المعلمات:
+        phone_number: رقم الهاتف أو جزء منه
+    
+    العائد:
+        الأرقام اللاتينية فقط
+    """
+    return _NON_DIGITS.sub("", str(phone_number or "").translate(_DIGITS_TRANSLATION))
+
+def normalize_phone(phone_number: Optional[str]) -> str:
+    """
+    تحويل رقم هاتف إلى صيغة E.164 (+ ثم رمز البلد ثم الرقم الوطني)
+    
+    يقبل الأرقام المحلية السورية والتركية (مع الصفر أو بدونه)، والأرقام
+    الدولية بـ + أو 00 أو برمز البلد مباشرة. الأرقام التي لا يمكن تحديد
+    بلدها تُعاد أرقاماً فقط كما هي.
+    
+    المعلمات:
+        phone_number: رقم الهاتف كما أُدخل
+    
+    العائد:
+        رقم الهاتف الموحد، أو نص فارغ إذا لم يحتوِ على أرقام
+    """
+    text = str(phone_number or "").strip()
+    digits = only_digits(text)
+    if not digits:
+        return ""
+    
+    if text.startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    
+    # رقم دولي بدون + (مثل 963933123456)
+    for country_code, _, national_length in COUNTRIES:
+        if digits.startswith(country_code) and len(digits) == len(country_code) + national_length:
+            return "+" + digits
+    
+    # رقم محلي، مع الصفر أو بدونه
+    national = digits[1:] if digits.startswith("0") else digits
+    for country_code, mobile_prefix, _ in COUNTRIES:
+        if national.startswith(mobile_prefix):
+            return "+" + country_code + national
+    
+    return digits
+
+def phone_digits(phone_number: Optional[str]) -> str:
+    """
+    الأرقام الموحدة لرقم الهاتف (صيغة E.164 بدون +)، وهي مفتاح الفهرس والبحث
+    
+    المعلمات:
+        phone_number: رقم الهاتف
+    
+    العائد:
+        أرقام الهاتف الموحدة
+    """
+    return normalize_phone(phone_number).lstrip("+")
+
+def normalize_many(phone_numbers: Iterable[Optional[str]]) -> List[str]:
+    """
+    توحيد مجموعة من أرقام الهواتف دفعة واحدة (للاستيراد والترحيل)
+    
+    الأرقام المكررة في الدفعة تُوحد مرة واحدة فقط.
+    
+    المعلمات:
+        phone_numbers: أرقام الهواتف
+    
+    العائد:
+        الأرقام الموحدة بنفس الترتيب
+    """
+    normalized: Dict[Optional[str], str] = {}
+    results = []
+    
+    for phone_number in phone_numbers:
+        if phone_number not in normalized:
+            normalized[phone_number] = normalize_phone(phone_number)
+        results.append(normalized[phone_number])
+    
+    return results
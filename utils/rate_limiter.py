@@ -0,0 +1,214 @@
+"""
+محدد معدل الإرسال - يجدول طلبات البوت الصادرة وفق حدود تيليجرام مع أولوية للردود التفاعلية
+"""
+
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+# مسارات الأولوية، تُمرر عبر rate_limit_args في دوال البوت
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+class _TokenBucket:
+    """دلو رموز يسمح بعدد max_rate من الطلبات في كل time_period ثانية"""
+    
+    __slots__ = ("capacity", "fill_rate", "tokens", "updated")
+    
+    def __init__(self, max_rate: float, time_period: float, now: float) -> None:
+        self.capacity = max_rate
+        self.fill_rate = max_rate / time_period
+        self.tokens = max_rate
+        self.updated = now
+    
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+    
+    def wait_time(self, now: float) -> float:
+        """عدد الثواني حتى يتوفر رمز"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.fill_rate
+    
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+    
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """
+    محدد معدل لطلبات البوت الصادرة
+    
+    كل طلب موجه إلى محادثة يمر عبر دلو رموز عام، وطلبات المجموعات والقنوات
+    تمر أيضاً عبر دلو خاص بالمحادثة (كما يفعل AIORateLimiter في المكتبة)؛
+    المحادثات الخاصة لا تُقيد بدلو خاص حتى لا تتأخر الردود التفاعلية متعددة
+    الخطوات وتعديلات الردود المتدفقة، ومؤشر الكتابة (sendChatAction) لا يُحتسب.
+    تُخدم الطلبات المنتظرة حسب الأولوية ثم حسب ترتيب الوصول، فتسبق الردود
+    التفاعلية حركة التذكيرات الجماعية. عند تلقي RetryAfter تتوقف جميع الطلبات
+    للمدة المطلوبة ثم يُعاد الطلب حتى max_retries مرة.
+    
+    تُحدد أولوية الطلب بتمرير rate_limit_args=PRIORITY_BULK إلى دالة البوت،
+    والأولوية الافتراضية PRIORITY_INTERACTIVE.
+    """
+    
+    # الحد الأقصى لعدد دلاء المحادثات المحفوظة قبل حذف الخاملة منها
+    MAX_CHAT_BUCKETS = 1000
+    
+    def __init__(
+        self,
+        overall_max_rate: float = 30,
+        overall_time_period: float = 1,
+        group_max_rate: float = 20,
+        group_time_period: float = 60,
+        max_retries: int = 3,
+    ) -> None:
+        self._overall_limits = (overall_max_rate, overall_time_period)
+        self._group_limits = (group_max_rate, group_time_period)
+        self._max_retries = max_retries
+        
+        self._overall: Optional[_TokenBucket] = None
+        self._chat_buckets: Dict[Union[int, str], _TokenBucket] = {}
+        self._waiters: List[Tuple[int, int, Optional[Union[int, str]], asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+    
+    async def initialize(self) -> None:
+        if self._dispatcher is None:
+            self._overall = _TokenBucket(*self._overall_limits, time.monotonic())
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+    
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        
+        for _, _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+        self._chat_buckets.clear()
+    
+    def _chat_bucket(self, chat_id: Union[int, str], now: float) -> _TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = _TokenBucket(*self._group_limits, now)
+        return bucket
+    
+    def _prune_chat_buckets(self, now: float) -> None:
+        if len(self._chat_buckets) <= self.MAX_CHAT_BUCKETS:
+            return
+        
+        waiting = {chat_id for _, _, chat_id, _ in self._waiters}
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if chat_id not in waiting and bucket.is_full(now):
+                del self._chat_buckets[chat_id]
+    
+    async def _dispatch(self) -> None:
+        """منح الرموز للطلبات المنتظرة حسب الأولوية"""
+        while True:
+            delay: Optional[float] = None
+            
+            if self._waiters:
+                now = time.monotonic()
+                delay = max(self._paused_until - now, self._overall.wait_time(now))
+                
+                if delay <= 0:
+                    delay = None
+                    for index, (_, _, group_id, future) in enumerate(self._waiters):
+                        chat_wait = 0.0 if group_id is None else self._chat_bucket(group_id, now).wait_time(now)
+                        if chat_wait <= 0:
+                            del self._waiters[index]
+                            if not future.done():
+                                self._overall.take(now)
+                                if group_id is not None:
+                                    self._chat_bucket(group_id, now).take(now)
+                                future.set_result(None)
+                            break
+                        delay = chat_wait if delay is None else min(delay, chat_wait)
+                    else:
+                        self._prune_chat_buckets(now)
+                    
+                    if delay is None:
+                        continue
+            
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _acquire(self, group_id: Optional[Union[int, str]], priority: int) -> None:
+        """انتظار دور الطلب (group_id للمجموعات والقنوات فقط، وNone للمحادثات الخاصة)"""
+        if self._dispatcher is None:
+            await self.initialize()
+        
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), group_id, future)
+        bisect.insort(self._waiters, entry)
+        self._wakeup.set()
+        
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            raise
+    
+    async def _wait_for_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]], None]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]], None]:
+        chat_id = data.get("chat_id")
+        priority = PRIORITY_INTERACTIVE if rate_limit_args is None else rate_limit_args
+        
+        for attempt in itertools.count():
+            # الطلبات غير الموجهة لمحادثة (مثل getFile) ومؤشر الكتابة لا تُحتسب ضمن حدود الرسائل
+            if chat_id is None or endpoint == "sendChatAction":
+                await self._wait_for_pause()
+            else:
+                # معرفات المجموعات والقنوات سالبة أو أسماء مستخدمين
+                is_group = isinstance(chat_id, str) or chat_id < 0
+                await self._acquire(chat_id if is_group else None, priority)
+            
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self._max_retries:
+                    raise
+                
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                
+                logger.warning(f"Flood limit hit on {endpoint}, pausing sends for {retry_after}s")
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after + 0.1)
+                await self._wait_for_pause()
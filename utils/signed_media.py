@@ -0,0 +1,99 @@
+"""
+روابط الوسائط الموقعة - روابط قصيرة الصلاحية موقعة بـ HMAC لصور الإشعارات تُقدَّم من خادم الويب
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+# المجلد الحالي
+current_dir = Path(__file__).parent.parent.absolute()
+IMAGES_DIR = current_dir / "data" / "images"
+
+# المسار الذي تُقدَّم منه الصور على خادم الويب
+MEDIA_ROUTE = "/media"
+
+# العنوان العام لخادم الويب، ومدة صلاحية الروابط بالثواني
+MEDIA_BASE_URL = (os.environ.get("MEDIA_BASE_URL") or os.environ.get("WEBHOOK_URL") or "").rstrip("/")
+MEDIA_URL_TTL = int(os.environ.get("MEDIA_URL_TTL", 900))
+
+def _signing_key() -> bytes:
+    """
+    مفتاح التوقيع: MEDIA_SIGNING_KEY إن وجد، وإلا مفتاح مشتق من توكن البوت
+    حتى تبقى الروابط صالحة بعد إعادة التشغيل
+    """
+    key = os.environ.get("MEDIA_SIGNING_KEY")
+    if key:
+        return key.encode()
+    
+    token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+    return hmac.new(token.encode(), b"signed-media", hashlib.sha256).digest()
+
+_SIGNING_KEY = _signing_key()
+
+def _signature(name: str, expires: int) -> str:
+    return hmac.new(_SIGNING_KEY, f"{name}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+def is_media_url_available() -> bool:
+    """
+    التحقق مما إذا كان العنوان العام لخادم الويب معروفاً لبناء الروابط
+    
+    العائد:
+        True إذا كان يمكن بناء روابط الوسائط، False خلاف ذلك
+    """
+    return bool(MEDIA_BASE_URL)
+
+def signed_media_url(image_path: str, ttl: Optional[int] = None) -> Optional[str]:
+    """
+    بناء رابط موقع لصورة إشعار
+    
+    المعلمات:
+        image_path: مسار الصورة النسبي (مثل data/images/<uuid>.jpg)
+        ttl: مدة صلاحية الرابط بالثواني (اختياري)
+    
+    العائد:
+        الرابط، أو None إذا لم يكن العنوان العام مضبوطاً
+    """
+    if not MEDIA_BASE_URL:
+        return None
+    
+    name = Path(image_path).name
+    expires = int(time.time()) + (ttl or MEDIA_URL_TTL)
+    return f"{MEDIA_BASE_URL}{MEDIA_ROUTE}/{quote(name)}?expires={expires}&signature={_signature(name, expires)}"
+
+def resolve_signed_media(name: str, expires: str, signature: str) -> Optional[Path]:
+    """
+    التحقق من توقيع رابط الوسائط وصلاحيته وإرجاع مسار الملف
+    
+    المعلمات:
+        name: اسم ملف الصورة
+        expires: وقت انتهاء الصلاحية (ثوانٍ منذ بداية التوقيت)
+        signature: التوقيع
+    
+    العائد:
+        مسار الملف إذا كان الرابط صالحاً والملف موجوداً، None خلاف ذلك
+    """
+    try:
+        expires_at = int(expires)
+    except (TypeError, ValueError):
+        return None
+    
+    if expires_at < time.time():
+        return None
+    
+    if not hmac.compare_digest(_signature(name, expires_at), signature or ""):
+        return None
+    
+    path = (IMAGES_DIR / name).resolve()
+    if path.parent != IMAGES_DIR.resolve() or not path.is_file():
+        return None
+    
+    return path
@@ -0,0 +1,174 @@
+"""
+وسائط تيليجرام - إرسال صور الإشعارات مع إعادة استخدام معرف الملف بدلاً من إعادة رفع الصورة
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from telegram import Bot, InputMediaPhoto, Message
+from telegram.error import BadRequest
+
+from utils.database import update_notification
+from utils.image_store import rendition_path
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+# المجلد الحالي
+current_dir = Path(__file__).parent.parent.absolute()
+
+# الحد الأقصى لعدد الصور في الألبوم الواحد لدى تيليجرام
+MEDIA_GROUP_SIZE = 10
+
+def _read_image(notification: Dict[str, Any]) -> bytes:
+    """
+    قراءة صورة الإشعار من القرص (النسخة المتوسطة إن وجدت) - تُنفذ في خيط
+    
+    تيليجرام يصغّر الصور إلى 1280 بكسل، فتكفي النسخة المتوسطة.
+    """
+    return Path(f"{current_dir}/{rendition_path(notification['image_path'], 'medium')}").read_bytes()
+
+def remember_file_id(notification: Dict[str, Any], message: Optional[Message], replace: bool = False) -> None:
+    """
+    حفظ معرف ملف الصورة التي أعادها تيليجرام مع سجل الإشعار
+    
+    تيليجرام قد يعيد معرفاً مختلفاً للملف نفسه في كل إرسال، لذلك لا يُكتب
+    المعرف إلا إذا لم يكن هناك معرف محفوظ أو رُفض المعرف المحفوظ.
+    
+    المعلمات:
+        notification: الإشعار
+        message: الرسالة المرسلة التي تحتوي على الصورة
+        replace: استبدال المعرف المحفوظ (عندما يرفضه تيليجرام)
+    """
+    if not message or not message.photo:
+        return
+    
+    if notification.get("telegram_file_id") and not replace:
+        return
+    
+    update_notification(notification["id"], {"telegram_file_id": message.photo[-1].file_id})
+
+async def send_notification_photo(
+    bot: Bot,
+    chat_id: Union[int, str],
+    notification: Dict[str, Any],
+    caption: Optional[str] = None,
+    rate_limit_args: Optional[int] = None,
+) -> Message:
+    """
+    إرسال صورة الإشعار
+    
+    تُرسل الصورة بمعرف الملف المحفوظ إن وجد، وإلا تُرفع من القرص مرة واحدة
+    ويُحفظ المعرف الذي يعيده تيليجرام للإرسالات اللاحقة.
+    
+    المعلمات:
+        bot: البوت
+        chat_id: معرف المحادثة
+        notification: الإشعار
+        caption: وصف الصورة
+        rate_limit_args: أولوية الإرسال لدى محدد المعدل (اختياري)
+    
+    العائد:
+        الرسالة المرسلة
+    """
+    file_id = notification.get("telegram_file_id")
+    rejected = False
+    if file_id:
+        try:
+            return await bot.send_photo(
+                chat_id=chat_id, photo=file_id, caption=caption, rate_limit_args=rate_limit_args
+            )
+        except BadRequest as e:
+            # المعرف لم يعد صالحاً، إعادة الرفع من القرص
+            logger.warning(f"Cached file_id rejected for notification {notification['id']}: {e}")
+            rejected = True
+    
+    image_data = await asyncio.to_thread(_read_image, notification)
+    message = await bot.send_photo(
+        chat_id=chat_id, photo=image_data, caption=caption, rate_limit_args=rate_limit_args
+    )
+    
+    remember_file_id(notification, message, replace=rejected)
+    return message
+
+async def _send_individually(
+    bot: Bot,
+    chat_id: Union[int, str],
+    items: List[Tuple[Dict[str, Any], Optional[str]]],
+    rate_limit_args: Optional[int] = None,
+) -> List[Message]:
+    """إرسال الصور واحدة تلو الأخرى مع تخطي الصور التي تعذرت قراءتها من القرص"""
+    messages = []
+    
+    for notification, caption in items:
+        try:
+            messages.append(await send_notification_photo(bot, chat_id, notification, caption, rate_limit_args))
+        except OSError as e:
+            logger.error(f"Error reading image for notification {notification['id']}: {e}")
+    
+    return messages
+
+async def send_notification_photos(
+    bot: Bot,
+    chat_id: Union[int, str],
+    items: List[Tuple[Dict[str, Any], Optional[str]]],
+    rate_limit_args: Optional[int] = None,
+) -> List[Message]:
+    """
+    إرسال صور مجموعة من الإشعارات كألبومات
+    
+    تُقسم الصور إلى ألبومات من MEDIA_GROUP_SIZE صورة كحد أقصى مع وصف لكل صورة،
+    وتُرسل الصورة المنفردة كرسالة عادية. إذا رفض تيليجرام الألبوم (مثلاً بسبب
+    معرف ملف منتهي الصلاحية) تُرسل صوره واحدة تلو الأخرى. الصورة التي تعذرت
+    قراءتها من القرص تُتخطى وحدها دون إيقاف بقية الصور.
+    
+    المعلمات:
+        bot: البوت
+        chat_id: معرف المحادثة
+        items: قائمة أزواج (الإشعار، وصف الصورة)
+        rate_limit_args: أولوية الإرسال لدى محدد المعدل (اختياري)
+    
+    العائد:
+        الرسائل المرسلة
+    """
+    messages = []
+    
+    for start in range(0, len(items), MEDIA_GROUP_SIZE):
+        chunk = items[start:start + MEDIA_GROUP_SIZE]
+        
+        if len(chunk) == 1:
+            messages.extend(await _send_individually(bot, chat_id, chunk, rate_limit_args))
+            continue
+        
+        media = []
+        ready = []
+        for notification, caption in chunk:
+            photo = notification.get("telegram_file_id")
+            if not photo:
+                try:
+                    photo = await asyncio.to_thread(_read_image, notification)
+                except OSError as e:
+                    logger.error(f"Error reading image for notification {notification['id']}: {e}")
+                    continue
+            media.append(InputMediaPhoto(media=photo, caption=caption))
+            ready.append((notification, caption))
+        
+        # الألبوم يتطلب صورتين على الأقل
+        if len(ready) < 2:
+            messages.extend(await _send_individually(bot, chat_id, ready, rate_limit_args))
+            continue
+        
+        try:
+            sent = await bot.send_media_group(chat_id=chat_id, media=media, rate_limit_args=rate_limit_args)
+        except BadRequest as e:
+            logger.warning(f"Media group rejected, sending photos individually: {e}")
+            messages.extend(await _send_individually(bot, chat_id, ready, rate_limit_args))
+            continue
+        
+        for (notification, _), message in zip(ready, sent):
+            remember_file_id(notification, message)
+        messages.extend(sent)
+    
+    return messages
@@ -0,0 +1,120 @@
+"""
+مرسل Twilio - عميل مشترك غير متزامن لإرسال الرسائل النصية دون حجب حلقة الأحداث
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+# استيراد Twilio إذا كان موجوداً
+try:
+    from twilio.rest import Client
+    TWILIO_AVAILABLE = True
+except ImportError:
+    TWILIO_AVAILABLE = False
+
+# النقل غير المتزامن يتطلب aiohttp-retry، وإلا تُنفذ الطلبات في مجموعة خيوط
+try:
+    from twilio.http.async_http_client import AsyncTwilioHttpClient
+    ASYNC_TRANSPORT_AVAILABLE = True
+except ImportError:
+    ASYNC_TRANSPORT_AVAILABLE = False
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+# الحصول على بيانات Twilio من متغيرات البيئة
+TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
+TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
+
+# الحد الأقصى لطلبات Twilio المتزامنة
+TWILIO_CONCURRENCY = int(os.environ.get("TWILIO_CONCURRENCY", 20))
+
+# العميل المشترك وموارده
+_client = None
+_executor: Optional[ThreadPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+def is_twilio_configured() -> bool:
+    """
+    التحقق مما إذا كانت مكتبة Twilio وبياناتها متوفرة
+    
+    العائد:
+        True إذا كان يمكن إرسال رسائل Twilio، False خلاف ذلك
+    """
+    return bool(TWILIO_AVAILABLE and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER)
+
+def get_twilio_client():
+    """
+    الحصول على عميل Twilio المشترك، وإنشاؤه عند أول استخدام
+    
+    يستخدم العميل جلسة HTTP واحدة تُعاد فيها الاتصالات بين الرسائل.
+    
+    العائد:
+        عميل Twilio أو None إذا لم يكن Twilio مضبوطاً
+    """
+    global _client, _executor
+    
+    if _client is None and is_twilio_configured():
+        if ASYNC_TRANSPORT_AVAILABLE:
+            _client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=AsyncTwilioHttpClient())
+        else:
+            logger.warning("aiohttp-retry not installed, running Twilio requests in a thread pool")
+            _client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+            _executor = ThreadPoolExecutor(max_workers=TWILIO_CONCURRENCY, thread_name_prefix="twilio")
+    
+    return _client
+
+async def send_twilio_message(to: str, body: str, media_url: Optional[List[str]] = None) -> str:
+    """
+    إرسال رسالة عبر Twilio
+    
+    المعلمات:
+        to: رقم المستلم
+        body: نص الرسالة
+        media_url: روابط الوسائط المرفقة (اختياري)
+    
+    العائد:
+        معرف الرسالة (SID)
+    """
+    global _semaphore
+    
+    client = get_twilio_client()
+    if client is None:
+        raise RuntimeError("Twilio is not configured")
+    
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(TWILIO_CONCURRENCY)
+    
+    params = {"body": body, "from_": TWILIO_PHONE_NUMBER, "to": to}
+    if media_url:
+        params["media_url"] = media_url
+    
+    async with _semaphore:
+        if _executor is None:
+            message = await client.messages.create_async(**params)
+        else:
+            loop = asyncio.get_running_loop()
+            message = await loop.run_in_executor(_executor, lambda: client.messages.create(**params))
+    
+    return message.sid
+
+async def close_twilio_client() -> None:
+    """إغلاق جلسة HTTP للعميل المشترك وإيقاف مجموعة الخيوط"""
+    global _client, _executor, _semaphore
+    
+    if _client is not None and ASYNC_TRANSPORT_AVAILABLE and _executor is None:
+        try:
+            await _client.http_client.close()
+        except Exception as e:
+            logger.error(f"Error closing Twilio HTTP session: {e}")
+    
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    
+    _client = None
+    _executor = None
+    _semaphore = None
@@ -0,0 +1,85 @@
+"""
+معالج التحديثات المتزامن - يعالج تحديثات المحادثات المختلفة بالتوازي مع الحفاظ على ترتيب تحديثات كل محادثة
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# إعداد السجل
+logger = logging.getLogger(__name__)
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    معالج تحديثات يسمح بمعالجة حتى max_concurrent_updates تحديثاً في نفس الوقت،
+    مع تسلسل تحديثات المحادثة الواحدة حتى تبقى حالات ConversationHandler صحيحة.
+    
+    process_update في المكتبة نهائية وتحجز مقعد BaseUpdateProcessor قبل
+    do_process_update، لذلك يُمرر إليها حد لا يُبلغ عملياً، ويُطبق الحد الفعلي
+    بمقاعد خاصة تُحجز داخل do_process_update بعد قفل المحادثة، حتى لا تشغل
+    تحديثات محادثة واحدة المنتظرة مقاعد المحادثات الأخرى.
+    """
+    
+    # حد مقاعد BaseUpdateProcessor (التحديثات المنتظرة لقفل محادثتها تمر منه)
+    PENDING_UPDATES_LIMIT = 1_000_000
+    
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max(max_concurrent_updates, self.PENDING_UPDATES_LIMIT))
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiters: Dict[int, int] = {}
+    
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        """
+        تحديد مفتاح التسلسل للتحديث
+        
+        العائد:
+            معرف المحادثة، أو معرف المستخدم إذا لم توجد محادثة، أو None
+        """
+        if not isinstance(update, Update):
+            return None
+        
+        if update.effective_chat:
+            return update.effective_chat.id
+        
+        if update.effective_user:
+            return update.effective_user.id
+        
+        return None
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        معالجة التحديث بعد انتظار انتهاء التحديثات السابقة من نفس المحادثة
+        
+        يُحجز قفل المحادثة أولاً ثم مقعد التوازي.
+        """
+        key = self._chat_key(update)
+        
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        
+        lock = self._chat_locks.setdefault(key, asyncio.Lock())
+        self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+        
+        try:
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            self._chat_waiters[key] -= 1
+            if not self._chat_waiters[key]:
+                del self._chat_waiters[key]
+                del self._chat_locks[key]
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
+        self._chat_waiters.clear()